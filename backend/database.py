@@ -1,11 +1,28 @@
 """SQLite database setup with 8 production-grade tables."""
 
-from sqlalchemy import create_engine, text
+import logging
+
+from sqlalchemy import create_engine, event, inspect, text
 from sqlalchemy.orm import sessionmaker, declarative_base
 
 DATABASE_URL = "sqlite:///./financial_coach.db"
 
+# Unique index on anomalies (one row per session, transaction and type)
+ANOMALY_UNIQUE_INDEX = "uq_anomalies_session_transaction_type"
+
+logger = logging.getLogger(__name__)
+
 engine = create_engine(DATABASE_URL, connect_args={"check_same_thread": False})
+
+
+@event.listens_for(engine, "connect")
+def _set_sqlite_pragmas(dbapi_connection, connection_record):
+    """WAL journaling with NORMAL sync: one fsync per checkpoint, not per commit."""
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.close()
+
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
 
@@ -28,6 +45,7 @@ def init_db():
     )
 
     Base.metadata.create_all(bind=engine)
+    migrate_anomaly_unique_index()
 
     # Seed default categories
     db = SessionLocal()
@@ -52,3 +70,50 @@ def init_db():
             db.commit()
     finally:
         db.close()
+
+
+def migrate_anomaly_unique_index(bind=None) -> None:
+    """
+    One-time migration adding the anomalies unique index to databases
+    created before it existed (create_all skips indexes on existing tables).
+
+    Does nothing once the index is present. Otherwise, in one transaction:
+    removes exact duplicates (same session, transaction and anomaly_type, keeping the
+    earliest row) and creates the index. Anomalies of different types for
+    the same transaction are kept. Any failure rolls the whole step back
+    and is raised, so it is retried on the next start.
+
+    Args:
+        bind: Engine to migrate (defaults to the application engine).
+    """
+    from models import Anomaly
+
+    index = next(ix for ix in Anomaly.__table__.indexes if ix.name == ANOMALY_UNIQUE_INDEX)
+
+    with (bind or engine).begin() as conn:
+        inspector = inspect(conn)
+        if not inspector.has_table("anomalies"):
+            return
+        existing = {ix["name"] for ix in inspector.get_indexes("anomalies")}
+        if ANOMALY_UNIQUE_INDEX in existing:
+            return
+
+        logger.info("Migrating anomalies: creating unique index %s", ANOMALY_UNIQUE_INDEX)
+
+        # NULLs never collide in a unique index, so those rows are left alone
+        removed = conn.execute(text(
+            "DELETE FROM anomalies "
+            "WHERE transaction_id IS NOT NULL AND anomaly_type IS NOT NULL "
+            "AND id NOT IN ("
+            "SELECT MIN(id) FROM anomalies "
+            "WHERE transaction_id IS NOT NULL AND anomaly_type IS NOT NULL "
+            "GROUP BY session_id, transaction_id, anomaly_type)"
+        )).rowcount
+        if removed:
+            logger.warning(
+                "Removed %d duplicate anomaly row(s) before creating %s",
+                removed, ANOMALY_UNIQUE_INDEX,
+            )
+
+        index.create(bind=conn)
+        logger.info("Created index %s", ANOMALY_UNIQUE_INDEX)
@@ -29,6 +29,7 @@ from services.observability import (
 )
 from services import (
     AIService, CSVProcessor, Categorizer,
+    shutdown_parse_pool,
     AnomalyDetector, RecurringDetector, InsightGenerator,
     ChatService, PatternAnalyzer, GoalForecaster,
     FortuneGenerator, build_financial_stats
@@ -49,7 +50,8 @@ from models import (
 )
 import os
 import time
-from contextlib import asynccontextmanager
+import asyncio
+from contextlib import asynccontextmanager, suppress
 from typing import Optional, Dict
 from collections import defaultdict
 
@@ -153,19 +155,28 @@ async def lifespan(app: FastAPI):
     On startup:
         - Initialize database tables
         - Seed default categories
+        - Prewarm the OpenAI connection pool (in the background)
 
     On shutdown:
-        - Cleanup resources if needed
+        - Close the shared OpenAI HTTP connection pool
+        - Stop the CSV parse worker processes (if a large upload started them)
     """
     # Startup
     print("🚀 Starting Smart Financial Coach API...")
     init_db()
     print("✅ Database initialized with default categories")
+    # Don't hold up boot on OpenAI; requests are served while this runs
+    prewarm_task = asyncio.create_task(AIService().prewarm())
 
     yield
 
     # Shutdown
     print("👋 Shutting down Smart Financial Coach API...")
+    prewarm_task.cancel()
+    with suppress(asyncio.CancelledError):
+        await prewarm_task
+    await AIService.aclose()
+    shutdown_parse_pool()
 
 
 # =============================================================================
@@ -468,39 +479,13 @@ async def create_sample_session(
     transactions = generator.generate()
 
     processor = CSVProcessor(db)
-
-    # Create session with user ownership
-    import uuid
-    session_id = str(uuid.uuid4())
-
-    session = Session(
-        id=session_id,
-        clerk_user_id=user_id,
-        filename="sample_data.csv",
-        row_count=len(transactions),
-        status="processing",
-        is_sample=True,
-        name="Sample Data",
-    )
-    db.add(session)
-
-    # Add transactions
-    for txn in transactions:
-        transaction = Transaction(
-            session_id=session_id,
-            date=txn["date"],
-            description=txn["description"],
-            amount=txn["amount"],
-            raw_description=txn["description"],
-        )
-        db.add(transaction)
-
-    db.commit()
+    session_id, row_count = processor.process_synthetic(
+        transactions, clerk_user_id=user_id, filename="sample_data.csv")
 
     return UploadResponse(
         session_id=session_id,
         filename="sample_data.csv",
-        row_count=len(transactions),
+        row_count=row_count,
         status="processing",
     )
 
@@ -972,7 +957,7 @@ def _add_pattern_insights(
     Returns:
         Number of insights added.
     """
-    insights_added = 0
+    insights = []
 
     # Add top pattern insights (limit to 3)
     for i, pattern in enumerate(patterns[:3]):
@@ -1027,8 +1012,7 @@ def _add_pattern_insights(
             confidence=0.85,
             data=pattern
         )
-        db.add(insight)
-        insights_added += 1
+        insights.append(insight)
 
     # Add savings capacity insight from forecast
     forecast_insights = forecast.get('insights', [])
@@ -1054,11 +1038,11 @@ def _add_pattern_insights(
             confidence=0.9,
             data=fi.get('data', {})
         )
-        db.add(insight)
-        insights_added += 1
+        insights.append(insight)
 
+    db.bulk_save_objects(insights, return_defaults=False)
     db.commit()
-    return insights_added
+    return len(insights)
 
 
 def _calculate_spending_summary(
@@ -112,6 +112,13 @@ class Anomaly(Base):
     session = relationship("Session", back_populates="anomalies")
     transaction = relationship("Transaction", back_populates="anomalies")
 
+    # One anomaly per transaction and type per session (bulk inserts skip
+    # duplicates)
+    __table_args__ = (
+        Index('uq_anomalies_session_transaction_type',
+              'session_id', 'transaction_id', 'anomaly_type', unique=True),
+    )
+
 
 class RecurringCharge(Base):
     """Subscription and recurring charge detection."""
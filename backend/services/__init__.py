@@ -1,7 +1,7 @@
 """Backend services for financial analysis."""
 
 from .ai_service import AIService
-from .csv_processor import CSVProcessor
+from .csv_processor import CSVProcessor, shutdown_parse_pool
 from .categorizer import Categorizer
 from .anomaly_detector import AnomalyDetector
 from .recurring_detector import RecurringDetector
@@ -15,6 +15,7 @@ from .fortune_generator import FortuneGenerator, build_financial_stats
 __all__ = [
     "AIService",
     "CSVProcessor",
+    "shutdown_parse_pool",
     "Categorizer",
     "AnomalyDetector",
     "RecurringDetector",
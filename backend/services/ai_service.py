@@ -6,76 +6,456 @@ Features:
     - Rate limit handling (429 errors)
     - Token usage tracking
     - Graceful fallback when API unavailable
+    - Circuit breaker to fail fast during upstream outages
 
 Author: Smart Financial Coach Team
 """
 
 import os
+import re
 import json
+import time
+import random
+import copy
 import asyncio
-from typing import Optional
-from functools import wraps
+import hashlib
+from typing import Any, Awaitable, Callable, Optional
+from functools import lru_cache
+from collections import Counter
+import httpx
 from dotenv import load_dotenv
 
+from .observability import metrics
+
 load_dotenv()
 
+# OpenAI SDK (optional - imported once; AI features fall back without it).
+# Errors worth retrying: rate limits, timeouts, dropped connections, 5xx
+try:
+    from openai import (
+        AsyncOpenAI, DefaultAsyncHttpxClient,
+        APIConnectionError, APITimeoutError, InternalServerError, RateLimitError
+    )
+    RETRYABLE_ERRORS: tuple = (
+        RateLimitError, APITimeoutError, APIConnectionError, InternalServerError
+    )
+except ImportError:
+    AsyncOpenAI = None
+    DefaultAsyncHttpxClient = None
+    RETRYABLE_ERRORS = ()
+
+# Fast JSON encode/decode (optional, falls back to stdlib json)
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Tool-call arguments larger than this are decoded in a worker thread
+JSON_OFFLOAD_MIN_BYTES = 64 * 1024
+
+
+def _json_default(obj: Any) -> Any:
+    """Numpy scalars/arrays become plain numbers/lists; anything else a string."""
+    tolist = getattr(obj, "tolist", None)
+    if callable(tolist):
+        return tolist()
+    return str(obj)
+
+
+def _json_dumps(obj: Any) -> str:
+    """Compact, key-sorted JSON (stable for caching, no wasted prompt tokens)."""
+    if orjson is not None:
+        return orjson.dumps(
+            obj,
+            default=_json_default,
+            option=orjson.OPT_SORT_KEYS | orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY,
+        ).decode("utf-8")
+    return json.dumps(obj, sort_keys=True, separators=(",", ":"), default=_json_default)
+
+
+def _json_loads(data: str | bytes) -> Any:
+    """Decode JSON with orjson when available."""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+async def _json_loads_async(data: str | bytes) -> Any:
+    """Decode JSON, moving large payloads off the event loop."""
+    if len(data) < JSON_OFFLOAD_MIN_BYTES:
+        return _json_loads(data)
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(None, _json_loads, data)
+
+
+# =============================================================================
+# Prompt Constants (built once at import time)
+# =============================================================================
+
+_CATEGORIZE_SYSTEM_PROMPT = (
+    "You are a financial transaction categorizer. Based on transaction patterns "
+    "(count, average amount, category hints), categorize each pattern into the "
+    "most appropriate category."
+)
+
+_CATEGORIZE_SYSTEM_MESSAGE = {"role": "system", "content": _CATEGORIZE_SYSTEM_PROMPT}
+
+# System prompt for insight generation (per-user data goes in the user message)
+_INSIGHTS_SYSTEM_PROMPT = """You are a friendly, knowledgeable financial coach. Your job is to
+analyze spending data and provide actionable insights that help users improve their
+financial health.
+
+Guidelines:
+- Be specific: use actual numbers from the data
+- Be actionable: every insight should suggest a concrete step
+- Be encouraging: celebrate wins, not just problems
+- Be explainable: always explain WHY you're making a recommendation
+- Prioritize: most impactful insights first (priority 1 = highest)
+
+Generate 4-6 insights covering:
+1. One spending pattern insight (largest category, trend)
+2. One anomaly alert if any exist (unusual transactions)
+3. One subscription/recurring review (especially gray charges)
+4. One savings opportunity (concrete $ amount)
+5. Optionally: a positive insight (good habit, improvement)
+
+Reading the data:
+- Amounts are in US dollars. Negative amounts are spending, positive amounts
+  are income or refunds.
+- "spending_summary.by_category" groups the period's transactions by category;
+  compare categories by absolute amount.
+- "anomalies" lists transactions flagged as unusual, each with a severity of
+  "low", "medium" or "high". Lead with high-severity items.
+- "recurring_charges" lists subscriptions and repeating charges; entries with
+  "is_gray_charge" true are small, easy-to-forget amounts and
+  "gray_charges_total" is their combined cost. Call these out explicitly.
+- "deltas" compares each category with the previous period; "change_percent"
+  is positive for increases.
+- If a section is missing or empty, do not invent data for it; skip that
+  insight type instead.
+
+Writing each insight:
+- title: a short headline under 60 characters, e.g. "Dining out up 30%".
+- description: one or two sentences under 200 characters that quote the
+  relevant dollar amounts or counts.
+- action: a single concrete next step under 100 characters, starting with a
+  verb (Review, Cancel, Set, Move, Compare).
+- reasoning: under 150 characters explaining why this matters.
+- confidence: 0.9+ when the numbers speak for themselves, 0.6-0.8 when
+  you are inferring intent, lower when the data is thin.
+- data: the key figures the insight is based on, so the app can render them.
+
+Savings estimates:
+- Round monthly savings to whole dollars and keep them realistic: suggest
+  trimming a category by 10-25%, not eliminating it.
+- Prefer cancelling unused subscriptions over cutting essentials such as
+  rent, utilities, groceries or insurance.
+
+Tone:
+- Plain language, no jargon, no judgement about past spending.
+- Never give investment, tax or legal advice; stick to budgeting habits."""
+
+_INSIGHTS_SYSTEM_MESSAGE = {"role": "system", "content": _INSIGHTS_SYSTEM_PROMPT}
+
 
 # =============================================================================
-# Retry Decorator with Exponential Backoff
+# Tool Schemas (built once; categorize variants keyed by category list)
 # =============================================================================
 
-def retry_with_backoff(
-    max_retries: int = 3,
-    initial_delay: float = 1.0,
-    max_delay: float = 60.0,
-    exponential_base: float = 2.0,
-    retryable_errors: tuple = None
-):
+_CONFIDENCE_SCHEMA = {"type": "number", "minimum": 0, "maximum": 1}
+
+_CATEGORIZE_TOOL_CHOICE = {
+    "type": "function", "function": {"name": "categorize_patterns"}
+}
+
+def _categorization_schema(categories: tuple[str, ...]) -> dict:
+    """Array schema for per-pattern categorizations; only the enum varies."""
+    return {
+        "type": "array",
+        "items": {
+            "type": "object",
+            "properties": {
+                "merchant_id": {"type": "string"},
+                "category": {"type": "string", "enum": list(categories)},
+                "confidence": _CONFIDENCE_SCHEMA,
+            },
+            "required": ["merchant_id", "category", "confidence"],
+        },
+    }
+
+
+@lru_cache(maxsize=32)
+def _categorize_tools(categories: tuple[str, ...]) -> list[dict]:
+    """Tool list for pattern categorization. Treat as read-only."""
+    return [
+        {
+            "type": "function",
+            "function": {
+                "name": "categorize_patterns",
+                "description": "Categorize aggregated transaction patterns",
+                "parameters": {
+                    "type": "object",
+                    "properties": {
+                        "categorizations": _categorization_schema(categories),
+                    },
+                    "required": ["categorizations"],
+                },
+            },
+        }
+    ]
+
+
+_INSIGHTS_TOOLS = [
+    {
+        "type": "function",
+        "function": {
+            "name": "generate_insights",
+            "description": "Generate personalized financial insights",
+            "parameters": {
+                "type": "object",
+                "properties": {
+                    "insights": {
+                        "type": "array",
+                        "items": {
+                            "type": "object",
+                            "properties": {
+                                "type": {
+                                    "type": "string",
+                                    "enum": [
+                                        "spending",
+                                        "anomaly",
+                                        "subscription",
+                                        "savings",
+                                        "positive",
+                                    ],
+                                },
+                                "priority": {"type": "integer", "minimum": 1, "maximum": 3},
+                                "title": {"type": "string", "maxLength": 60},
+                                "description": {"type": "string", "maxLength": 200},
+                                "action": {"type": "string", "maxLength": 100},
+                                "reasoning": {"type": "string", "maxLength": 150},
+                                "confidence": _CONFIDENCE_SCHEMA,
+                                "data": {"type": "object"},
+                            },
+                            "required": [
+                                "type",
+                                "priority",
+                                "title",
+                                "description",
+                                "reasoning",
+                                "confidence",
+                            ],
+                        },
+                    }
+                },
+                "required": ["insights"],
+            },
+        },
+    }
+]
+
+_INSIGHTS_TOOL_CHOICE = {
+    "type": "function", "function": {"name": "generate_insights"}
+}
+
+
+# =============================================================================
+# Structured Output Schemas (strict json_schema response_format)
+# =============================================================================
+# Strict mode requires every property to be listed in "required" and
+# additionalProperties: false, and ignores range/length keywords; optional
+# fields are expressed as nullable and stripped after parsing.
+
+def _strict_categorization_schema(categories: tuple[str, ...]) -> dict:
+    return {
+        "type": "array",
+        "items": {
+            "type": "object",
+            "properties": {
+                "merchant_id": {"type": "string"},
+                "category": {"type": "string", "enum": list(categories)},
+                "confidence": {"type": "number"},
+            },
+            "required": ["merchant_id", "category", "confidence"],
+            "additionalProperties": False,
+        },
+    }
+
+
+@lru_cache(maxsize=32)
+def _categorize_response_format(categories: tuple[str, ...]) -> dict:
+    """response_format for pattern categorization. Treat as read-only."""
+    return {
+        "type": "json_schema",
+        "json_schema": {
+            "name": "categorize_patterns",
+            "strict": True,
+            "schema": {
+                "type": "object",
+                "properties": {
+                    "categorizations": _strict_categorization_schema(categories),
+                },
+                "required": ["categorizations"],
+                "additionalProperties": False,
+            },
+        },
+    }
+
+
+_NULLABLE_STRING = {"type": ["string", "null"]}
+_NULLABLE_NUMBER = {"type": ["number", "null"]}
+
+_INSIGHTS_RESPONSE_FORMAT = {
+    "type": "json_schema",
+    "json_schema": {
+        "name": "generate_insights",
+        "strict": True,
+        "schema": {
+            "type": "object",
+            "properties": {
+                "insights": {
+                    "type": "array",
+                    "items": {
+                        "type": "object",
+                        "properties": {
+                            "type": {
+                                "type": "string",
+                                "enum": [
+                                    "spending",
+                                    "anomaly",
+                                    "subscription",
+                                    "savings",
+                                    "positive",
+                                ],
+                            },
+                            "priority": {"type": "integer", "enum": [1, 2, 3]},
+                            "title": {"type": "string"},
+                            "description": {"type": "string"},
+                            "action": _NULLABLE_STRING,
+                            "reasoning": {"type": "string"},
+                            "confidence": {"type": "number"},
+                            "data": {
+                                "type": ["object", "null"],
+                                "properties": {
+                                    "category": _NULLABLE_STRING,
+                                    "amount": _NULLABLE_NUMBER,
+                                    "count": _NULLABLE_NUMBER,
+                                    "savings": _NULLABLE_NUMBER,
+                                },
+                                "required": ["category", "amount", "count", "savings"],
+                                "additionalProperties": False,
+                            },
+                        },
+                        "required": [
+                            "type",
+                            "priority",
+                            "title",
+                            "description",
+                            "action",
+                            "reasoning",
+                            "confidence",
+                            "data",
+                        ],
+                        "additionalProperties": False,
+                    },
+                }
+            },
+            "required": ["insights"],
+            "additionalProperties": False,
+        },
+    },
+}
+
+# Models that accept strict json_schema response_format; others keep tools
+STRUCTURED_OUTPUT_MODEL_PREFIXES = ("gpt-4o", "gpt-4.1", "gpt-5", "o1", "o3", "o4")
+STRUCTURED_OUTPUT_EXCLUDED_MODELS = ("gpt-4o-2024-05-13", "o1-mini", "o1-preview")
+
+
+def _drop_nulls(insight: dict) -> dict:
+    """Strip the nullable placeholders strict mode forces on optional fields."""
+    cleaned = {k: v for k, v in insight.items() if v is not None}
+    data = cleaned.get("data")
+    if isinstance(data, dict):
+        cleaned["data"] = {k: v for k, v in data.items() if v is not None}
+    return cleaned
+
+
+# =============================================================================
+# Circuit Breaker
+# =============================================================================
+
+class CircuitOpenError(RuntimeError):
+    """Raised instead of calling OpenAI while the circuit breaker is open."""
+
+
+class _CircuitBreaker:
     """
-    Decorator for async functions that implements retry with exponential backoff.
-
-    Args:
-        max_retries: Maximum number of retry attempts.
-        initial_delay: Initial delay in seconds before first retry.
-        max_delay: Maximum delay between retries.
-        exponential_base: Base for exponential backoff calculation.
-        retryable_errors: Tuple of exception types to retry on.
+    Fail fast while OpenAI is down instead of waiting out every timeout.
+
+    Opens after `failure_threshold` consecutive failures. While open, calls
+    are rejected until the cooldown expires; then a single probe is let
+    through (half-open). A successful probe closes the breaker, a failed one
+    re-opens it with double the cooldown (capped at `max_cooldown`).
     """
-    if retryable_errors is None:
-        retryable_errors = (Exception,)
 
-    def decorator(func):
-        @wraps(func)
-        async def wrapper(*args, **kwargs):
-            last_exception = None
-            delay = initial_delay
+    def __init__(
+        self,
+        failure_threshold: int = 5,
+        base_cooldown: float = 0.5,
+        max_cooldown: float = 60.0,
+    ):
+        self.failure_threshold = failure_threshold
+        self.base_cooldown = base_cooldown
+        self.max_cooldown = max_cooldown
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self.cooldown = 0.0
+        self._open_count = 0
+        self._probe_in_flight = False
 
-            for attempt in range(max_retries + 1):
-                try:
-                    return await func(*args, **kwargs)
-                except retryable_errors as e:
-                    last_exception = e
-                    error_str = str(e).lower()
-
-                    # Check for rate limit errors (429)
-                    if "rate_limit" in error_str or "429" in error_str:
-                        # Use longer delay for rate limits
-                        delay = min(delay * 2, max_delay)
-                        print(
-                            f"⏳ Rate limited, waiting {delay:.1f}s (attempt {attempt + 1}/{max_retries + 1})")
-                    elif attempt < max_retries:
-                        print(
-                            f"⚠️ API error, retrying in {delay:.1f}s (attempt {attempt + 1}/{max_retries + 1}): {e}")
-
-                    if attempt < max_retries:
-                        await asyncio.sleep(delay)
-                        delay = min(delay * exponential_base, max_delay)
-                    else:
-                        raise last_exception
-
-            raise last_exception
-        return wrapper
-    return decorator
+    def allow(self) -> bool:
+        """Return True if a call may go through right now."""
+        if self.state == "closed":
+            return True
+        if self.state == "open":
+            if time.monotonic() - self.opened_at < self.cooldown:
+                return False
+            self.state = "half_open"
+            self._probe_in_flight = False
+        # Half-open: exactly one probe at a time
+        if self._probe_in_flight:
+            return False
+        self._probe_in_flight = True
+        return True
+
+    def release_probe(self) -> None:
+        """Let the next caller probe if this one ended without a verdict."""
+        self._probe_in_flight = False
+
+    def record_success(self) -> None:
+        if self.state != "closed":
+            print("✅ OpenAI circuit closed")
+        self.state = "closed"
+        self.failures = 0
+        self._open_count = 0
+        self._probe_in_flight = False
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        if self.state == "half_open" or self.failures >= self.failure_threshold:
+            self._open()
+
+    def _open(self) -> None:
+        self.cooldown = min(
+            self.max_cooldown, self.base_cooldown * 2 ** self._open_count
+        )
+        self._open_count += 1
+        self.state = "open"
+        self.opened_at = time.monotonic()
+        self._probe_in_flight = False
+        metrics.increment("openai.circuit_open")
+        print(f"🔌 OpenAI circuit open for {self.cooldown:.1f}s after {self.failures} failure(s)")
 
 
 class AIService:
@@ -89,26 +469,65 @@ class AIService:
         - Graceful fallback when API unavailable
     """
 
-    # Rate limit settings
-    MAX_RETRIES = 3
-    INITIAL_DELAY = 1.0
-    MAX_DELAY = 60.0
+    # Rate limit settings (5 attempts, 0.5s base, 30s cap)
+    MAX_RETRIES = 4
+    INITIAL_DELAY = 0.5
+    MAX_DELAY = 30.0
+
+    # Contexts with fewer categories (and no anomalies / gray charges) skip AI
+    TRIVIAL_CONTEXT_MIN_CATEGORIES = 3
+
+    # Prompt context caps (largest entries by absolute amount are kept)
+    CONTEXT_MAX_CATEGORIES = 15
+    CONTEXT_MAX_ANOMALIES = 10
+    CONTEXT_MAX_RECURRING = 15
+    CONTEXT_MAX_DELTAS = 10
+
+    # Category count above which fallback aggregation uses pandas
+    FALLBACK_VECTORIZE_MIN_CATEGORIES = 32
+
+    # Result cache TTLs (seconds) - identical inputs are not re-billed
+    CACHE_TTL_SECONDS = {
+        "insights": 15 * 60,
+        "categorize": 24 * 60 * 60,  # Merchant patterns are stable
+        "goal_advice": 60 * 60,
+    }
+    MAX_CACHE_ENTRIES = 1024
+
+    # Connection pool size for the shared HTTP client
+    HTTP_MAX_CONNECTIONS = 100
+
+    # Startup prewarm must not hold up boot when OpenAI is unreachable
+    PREWARM_TIMEOUT = 5.0
+
+    # Shared across instances (a new AIService is created per request)
+    _http_client: Optional["httpx.AsyncClient"] = None
+    _ai_cache: dict[str, tuple[float, Any]] = {}
+    _inflight: dict[str, asyncio.Task] = {}
+    _breaker = _CircuitBreaker()
 
     def __init__(self):
         raw_key = os.getenv("OPENAI_API_KEY", "")
         self.api_key = raw_key.strip() if raw_key else None
         self.model = os.getenv("OPENAI_MODEL", "gpt-4o")
+        # Cheaper tier for short replies (e.g. goal advice)
+        self.model_lite = os.getenv("OPENAI_MODEL_LITE", "gpt-4o-mini")
         self.client = None
+        self.structured_outputs = self._supports_structured_outputs(self.model)
 
         # Token usage tracking
         self.total_tokens_used = 0
         self.request_count = 0
 
         # Only initialize client if API key is available and valid
-        if self.api_key and self.api_key.startswith("sk-"):
+        if AsyncOpenAI is None:
+            print("⚠️ openai package not installed. AI features will use fallback mode.")
+        elif self.api_key and self.api_key.startswith("sk-"):
             try:
-                from openai import AsyncOpenAI
-                self.client = AsyncOpenAI(api_key=self.api_key)
+                self.client = AsyncOpenAI(
+                    api_key=self.api_key,
+                    http_client=self._get_http_client(),
+                )
                 print(f"✅ OpenAI client initialized (model: {self.model})")
             except Exception as e:
                 print(f"⚠️ Failed to initialize OpenAI client: {e}")
@@ -116,6 +535,35 @@ class AIService:
         else:
             print("⚠️ OpenAI API key not configured. AI features will use fallback mode.")
 
+    @classmethod
+    def _get_http_client(cls) -> "httpx.AsyncClient":
+        """
+        Process-wide pooled HTTP client shared by every AIService instance.
+
+        Reusing one pool keeps TCP+TLS connections warm across requests;
+        HTTP/2 multiplexes concurrent completions over a single connection when the h2 package is installed. Built on the
+        SDK's DefaultAsyncHttpxClient so its timeout and redirect defaults
+        still apply; only the pool size is raised.
+        """
+        if cls._http_client is None or cls._http_client.is_closed:
+            limits = httpx.Limits(
+                max_connections=cls.HTTP_MAX_CONNECTIONS,
+                max_keepalive_connections=cls.HTTP_MAX_CONNECTIONS,
+            )
+            try:
+                cls._http_client = DefaultAsyncHttpxClient(http2=True, limits=limits)
+            except ImportError:
+                # h2 not installed - fall back to HTTP/1.1 keep-alive pooling
+                cls._http_client = DefaultAsyncHttpxClient(limits=limits)
+        return cls._http_client
+
+    @classmethod
+    async def aclose(cls) -> None:
+        """Close the shared HTTP client (called on application shutdown)."""
+        if cls._http_client is not None:
+            await cls._http_client.aclose()
+            cls._http_client = None
+
     def _track_usage(self, response) -> None:
         """Track token usage from API response."""
         if hasattr(response, 'usage') and response.usage:
@@ -133,6 +581,77 @@ class AIService:
             )
         }
 
+    def _cache_key(self, kind: str, payload: dict) -> str:
+        """SHA-256 of the canonicalized request input."""
+        raw = _json_dumps({"kind": kind, "model": self.model, "payload": payload})
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def _cache_get(self, kind: str, key: str) -> Optional[Any]:
+        """Return a cached value if present and not expired."""
+        entry = self._ai_cache.get(key)
+        if entry is None:
+            return None
+        stored_at, value = entry
+        if time.time() - stored_at >= self.CACHE_TTL_SECONDS[kind]:
+            self._ai_cache.pop(key, None)
+            return None
+        return value
+
+    def _cache_put(self, key: str, value: Any) -> None:
+        """Store a value, evicting the oldest entry when full."""
+        if len(self._ai_cache) >= self.MAX_CACHE_ENTRIES:
+            # Evict the oldest entry (dicts keep insertion order)
+            self._ai_cache.pop(next(iter(self._ai_cache)), None)
+        self._ai_cache[key] = (time.time(), value)
+
+    async def _cached(
+        self, kind: str, payload: dict, compute: Callable[[], Awaitable[Any]]
+    ) -> Any:
+        """
+        Memoize an AI call by content hash with a per-kind TTL.
+
+        Concurrent identical calls are coalesced (single-flight): the first
+        caller starts `compute` as its own task and every caller, the first
+        included, awaits it through asyncio.shield, so a cache miss still
+        reaches OpenAI exactly once. A cancelled caller only stops waiting;
+        the task runs on for the others and its result is still cached.
+        Exceptions propagate to every waiter and are never cached.
+
+        Every caller gets its own deep copy, so mutating a result (e.g.
+        adding keys before persisting) can't corrupt the cached entry.
+        """
+        key = self._cache_key(kind, payload)
+        value = self._cache_get(kind, key)
+        if value is not None:
+            metrics.increment("ai_cache.hit", tags={"kind": kind})
+            return copy.deepcopy(value)
+
+        task = self._inflight.get(key)
+        if task is not None:
+            metrics.increment("ai_cache.coalesced", tags={"kind": kind})
+        else:
+            metrics.increment("ai_cache.miss", tags={"kind": kind})
+            task = asyncio.ensure_future(self._compute_and_cache(key, compute))
+            self._inflight[key] = task
+            task.add_done_callback(lambda done: self._finish_inflight(key, done))
+
+        return copy.deepcopy(await asyncio.shield(task))
+
+    async def _compute_and_cache(
+        self, key: str, compute: Callable[[], Awaitable[Any]]
+    ) -> Any:
+        """Body of a single-flight task: run `compute` and cache its result."""
+        value = await compute()
+        self._cache_put(key, value)
+        return value
+
+    def _finish_inflight(self, key: str, task: asyncio.Task) -> None:
+        """Drop a finished single-flight task from the in-flight table."""
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        if not task.cancelled():
+            task.exception()  # Mark retrieved when every waiter was cancelled
+
     async def categorize_transactions(
         self, aggregated_patterns: list[dict], categories: list[str]
     ) -> list[dict]:
@@ -147,116 +666,148 @@ class AIService:
             print("⚠️ AI categorization skipped - no API key")
             return []
 
-        # Format aggregated patterns for AI (no raw merchant names)
-        pattern_text = "\n".join(
-            f"Pattern {p['merchant_id']}: {p['transaction_count']} transactions, "
-            f"avg ${p['avg_amount']:.2f}, hints: {', '.join(p.get('category_hints', []))}"
-            for p in aggregated_patterns
-        )
-
-        try:
+        async def request() -> list[dict]:
             response = await self._call_with_retry(
-                messages=[
-                    {
-                        "role": "system",
-                        "content": "You are a financial transaction categorizer. Based on transaction patterns (count, average amount, category hints), categorize each pattern into the most appropriate category.",
-                    },
-                    {
-                        "role": "user",
-                        "content": f"Categorize these transaction patterns into one of these categories: {', '.join(categories)}\n\nPatterns:\n{pattern_text}",
-                    },
-                ],
-                tools=[
-                    {
-                        "type": "function",
-                        "function": {
-                            "name": "categorize_patterns",
-                            "description": "Categorize aggregated transaction patterns",
-                            "parameters": {
-                                "type": "object",
-                                "properties": {
-                                    "categorizations": {
-                                        "type": "array",
-                                        "items": {
-                                            "type": "object",
-                                            "properties": {
-                                                "merchant_id": {"type": "string"},
-                                                "category": {
-                                                    "type": "string",
-                                                    "enum": categories,
-                                                },
-                                                "confidence": {
-                                                    "type": "number",
-                                                    "minimum": 0,
-                                                    "maximum": 1,
-                                                },
-                                            },
-                                            "required": ["merchant_id", "category", "confidence"],
-                                        },
-                                    }
-                                },
-                                "required": ["categorizations"],
-                            },
-                        },
-                    }
-                ],
-                tool_choice={"type": "function", "function": {
-                    "name": "categorize_patterns"}},
+                **self._build_categorize_request(aggregated_patterns, categories),
                 timeout=30,
             )
 
-            tool_call = response.choices[0].message.tool_calls[0]
-            result = json.loads(tool_call.function.arguments)
+            result = await _json_loads_async(
+                self._output_text(response.choices[0].message)
+            )
             return result.get("categorizations", [])
 
+        try:
+            return await self._cached(
+                "categorize",
+                {"patterns": aggregated_patterns, "categories": categories},
+                request,
+            )
         except Exception as e:
             print(f"AI categorization error after retries: {e}")
             return []
 
+    @staticmethod
+    def _supports_structured_outputs(model: str) -> bool:
+        """
+        Whether `model` accepts strict json_schema response_format.
+
+        Set OPENAI_STRUCTURED_OUTPUTS=false to force the function-calling path.
+        """
+        if os.getenv("OPENAI_STRUCTURED_OUTPUTS", "auto").strip().lower() in ("0", "false", "no"):
+            return False
+        if model.startswith(STRUCTURED_OUTPUT_EXCLUDED_MODELS):
+            return False
+        return model.startswith(STRUCTURED_OUTPUT_MODEL_PREFIXES)
+
+    @staticmethod
+    def _output_text(message: Any) -> str:
+        """JSON text from a completion message (structured content or tool call)."""
+        if message.tool_calls:
+            return message.tool_calls[0].function.arguments
+        return message.content
+
+    def _build_categorize_request(
+        self, aggregated_patterns: list[dict], categories: list[str]
+    ) -> dict:
+        """Build the chat completion payload for pattern categorization."""
+        pattern_text = self._format_patterns(aggregated_patterns)
+
+        return {
+            "messages": [
+                _CATEGORIZE_SYSTEM_MESSAGE,
+                {
+                    "role": "user",
+                    "content": f"Categorize these transaction patterns into one of these categories: {', '.join(categories)}\n\nPatterns:\n{pattern_text}",
+                },
+            ],
+            **self._output_format(
+                _categorize_response_format,
+                _categorize_tools,
+                _CATEGORIZE_TOOL_CHOICE,
+                categories,
+            ),
+        }
+
+    def _output_format(
+        self,
+        response_format: Callable[[tuple[str, ...]], dict],
+        tools: Callable[[tuple[str, ...]], list[dict]],
+        tool_choice: dict,
+        categories: list[str],
+    ) -> dict:
+        """Pick structured outputs or function calling for a categorize payload."""
+        key = tuple(categories)
+        if self.structured_outputs:
+            return {"response_format": response_format(key)}
+        return {"tools": tools(key), "tool_choice": tool_choice}
+
+    def _format_patterns(self, aggregated_patterns: list[dict]) -> str:
+        """Format aggregated patterns for AI (no raw merchant names)."""
+        lines = [None] * len(aggregated_patterns)
+        for i, p in enumerate(aggregated_patterns):
+            hints = ", ".join(p.get("category_hints") or ())
+            lines[i] = (
+                f"Pattern {p['merchant_id']}: {p['transaction_count']} transactions, "
+                f"avg ${p['avg_amount']:.2f}, hints: {hints}"
+            )
+        return "\n".join(lines)
+
     async def _call_with_retry(self, **kwargs) -> any:
         """
-        Make OpenAI API call with retry logic for rate limits.
+        Make OpenAI API call with retry logic for transient failures.
+
+        Retries only RateLimitError, APITimeoutError, APIConnectionError and
+        5xx InternalServerError. Delay is base * 2**attempt (capped) plus
+        jitter; on 429 the server's Retry-After header wins when present.
+        Other errors are raised immediately.
 
-        Implements exponential backoff for:
-        - 429 Rate Limit errors
-        - 500/502/503 Server errors
-        - Network timeouts
+        Calls share a circuit breaker: once retries are exhausted repeatedly,
+        CircuitOpenError is raised without contacting OpenAI so callers drop
+        straight to their fallbacks.
         """
-        last_exception = None
-        delay = self.INITIAL_DELAY
+        kwargs.setdefault("model", self.model)
 
-        for attempt in range(self.MAX_RETRIES + 1):
-            try:
-                response = await self.client.chat.completions.create(
-                    model=self.model,
-                    **kwargs
-                )
-                self._track_usage(response)
-                return response
+        if not self._breaker.allow():
+            metrics.increment("openai.circuit_rejected")
+            raise CircuitOpenError("OpenAI circuit open; skipping call")
 
-            except Exception as e:
-                last_exception = e
-                error_str = str(e).lower()
+        try:
+            for attempt in range(self.MAX_RETRIES + 1):
+                try:
+                    response = await self.client.chat.completions.create(**kwargs)
+                    self._track_usage(response)
+                    self._breaker.record_success()
+                    return response
 
-                # Check if retryable error
-                is_rate_limit = "rate_limit" in error_str or "429" in error_str
-                is_server_error = any(code in error_str for code in [
-                                      "500", "502", "503"])
-                is_timeout = "timeout" in error_str
+                except RETRYABLE_ERRORS as e:
+                    if attempt >= self.MAX_RETRIES:
+                        self._breaker.record_failure()
+                        raise
 
-                if is_rate_limit or is_server_error or is_timeout:
-                    if attempt < self.MAX_RETRIES:
-                        wait_time = delay * (2 if is_rate_limit else 1)
-                        print(
-                            f"⏳ API error, retrying in {wait_time:.1f}s (attempt {attempt + 1}/{self.MAX_RETRIES + 1})")
-                        await asyncio.sleep(wait_time)
-                        delay = min(delay * 2, self.MAX_DELAY)
-                        continue
+                    delay = min(self.MAX_DELAY, self.INITIAL_DELAY * 2 ** attempt)
+                    delay += random.random() * 0.1
+                    retry_after = self._retry_after_seconds(e)
+                    if retry_after is not None:
+                        delay = min(self.MAX_DELAY, retry_after)
 
-                # Non-retryable error or max retries reached
-                raise last_exception
+                    print(
+                        f"⏳ {type(e).__name__}, retrying in {delay:.1f}s (attempt {attempt + 1}/{self.MAX_RETRIES + 1})")
+                    await asyncio.sleep(delay)
+        finally:
+            # Non-retryable errors and cancellation must not strand a probe
+            self._breaker.release_probe()
 
-        raise last_exception
+    @staticmethod
+    def _retry_after_seconds(error: Exception) -> Optional[float]:
+        """Read the Retry-After header (seconds) from a 429 response, if any."""
+        response = getattr(error, "response", None)
+        if response is None:
+            return None
+        try:
+            return float(response.headers.get("retry-after"))
+        except (TypeError, ValueError):
+            return None
 
     async def generate_insights(self, context: dict) -> list[dict]:
         """Generate financial insights using function calling."""
@@ -265,114 +816,138 @@ class AIService:
             print("⚠️ AI insights skipped - using fallback insights")
             return self._fallback_insights(context)
 
-        system_prompt = """You are a friendly, knowledgeable financial coach. Your job is to
-analyze spending data and provide actionable insights that help users improve their
-financial health.
-
-Guidelines:
-- Be specific: use actual numbers from the data
-- Be actionable: every insight should suggest a concrete step
-- Be encouraging: celebrate wins, not just problems
-- Be explainable: always explain WHY you're making a recommendation
-- Prioritize: most impactful insights first (priority 1 = highest)
-
-Generate 4-6 insights covering:
-1. One spending pattern insight (largest category, trend)
-2. One anomaly alert if any exist (unusual transactions)
-3. One subscription/recurring review (especially gray charges)
-4. One savings opportunity (concrete $ amount)
-5. Optionally: a positive insight (good habit, improvement)"""
+        if self._is_trivial_context(context):
+            return self._fallback_insights(context)
 
-        try:
+        async def request() -> list[dict]:
             response = await self._call_with_retry(
-                messages=[
-                    {"role": "system", "content": system_prompt},
-                    {
-                        "role": "user",
-                        "content": f"Analyze this financial data and generate insights:\n{json.dumps(context, indent=2)}",
-                    },
-                ],
-                tools=[
-                    {
-                        "type": "function",
-                        "function": {
-                            "name": "generate_insights",
-                            "description": "Generate personalized financial insights",
-                            "parameters": {
-                                "type": "object",
-                                "properties": {
-                                    "insights": {
-                                        "type": "array",
-                                        "items": {
-                                            "type": "object",
-                                            "properties": {
-                                                "type": {
-                                                    "type": "string",
-                                                    "enum": [
-                                                        "spending",
-                                                        "anomaly",
-                                                        "subscription",
-                                                        "savings",
-                                                        "positive",
-                                                    ],
-                                                },
-                                                "priority": {
-                                                    "type": "integer",
-                                                    "minimum": 1,
-                                                    "maximum": 3,
-                                                },
-                                                "title": {
-                                                    "type": "string",
-                                                    "maxLength": 60,
-                                                },
-                                                "description": {
-                                                    "type": "string",
-                                                    "maxLength": 200,
-                                                },
-                                                "action": {
-                                                    "type": "string",
-                                                    "maxLength": 100,
-                                                },
-                                                "reasoning": {
-                                                    "type": "string",
-                                                    "maxLength": 150,
-                                                },
-                                                "confidence": {
-                                                    "type": "number",
-                                                    "minimum": 0,
-                                                    "maximum": 1,
-                                                },
-                                                "data": {"type": "object"},
-                                            },
-                                            "required": [
-                                                "type",
-                                                "priority",
-                                                "title",
-                                                "description",
-                                                "reasoning",
-                                                "confidence",
-                                            ],
-                                        },
-                                    }
-                                },
-                                "required": ["insights"],
-                            },
-                        },
-                    }
-                ],
-                tool_choice={"type": "function", "function": {
-                    "name": "generate_insights"}},
+                **self._build_insights_request(context),
                 timeout=30,
             )
+            result = await _json_loads_async(
+                self._output_text(response.choices[0].message)
+            )
+            return [_drop_nulls(insight) for insight in result.get("insights", [])]
 
-            tool_call = response.choices[0].message.tool_calls[0]
-            result = json.loads(tool_call.function.arguments)
-            return result.get("insights", [])
-
+        try:
+            return await self._cached("insights", {"context": context}, request)
         except Exception as e:
             print(f"AI insight generation error after retries: {e}")
             return self._fallback_insights(context)
 
+    def _is_trivial_context(self, context: dict) -> bool:
+        """
+        True when the data is too thin for the model to beat the rule-based
+        insights: few categories, no anomalies and no gray charges.
+        """
+        summary = context.get("spending_summary") or {}
+        n_categories = len(summary.get("by_category") or {})
+        trivial = (
+            n_categories < self.TRIVIAL_CONTEXT_MIN_CATEGORIES
+            and not context.get("anomalies")
+            and not context.get("gray_charges_total")
+        )
+        if trivial:
+            metrics.increment("ai_insights.trivial_skip")
+        return trivial
+
+    def _shrink_context(self, context: dict) -> dict:
+        """
+        Keep only the fields the insights prompt refers to.
+
+        Lists are capped to their largest entries by absolute amount and
+        floats rounded to cents, so big sessions don't inflate prompt tokens.
+        """
+        def money(value: Any) -> Any:
+            return round(value, 2) if isinstance(value, float) else value
+
+        def largest(items: list[dict], limit: int, key: str = "amount") -> list[dict]:
+            return sorted(items, key=lambda x: abs(x.get(key) or 0), reverse=True)[:limit]
+
+        summary = context.get("spending_summary") or {}
+        by_category = summary.get("by_category") or {}
+        top_categories = sorted(
+            by_category.items(),
+            key=lambda item: abs(item[1].get("amount") or 0),
+            reverse=True,
+        )[:self.CONTEXT_MAX_CATEGORIES]
+
+        return {
+            "spending_summary": {
+                "total_income": money(summary.get("total_income")),
+                "total_spending": money(summary.get("total_spending")),
+                "net": money(summary.get("net")),
+                "by_category": {
+                    name: {
+                        "amount": money(data.get("amount")),
+                        "count": data.get("count"),
+                        "is_essential": data.get("is_essential"),
+                    }
+                    for name, data in top_categories
+                },
+            },
+            "anomalies": [
+                {
+                    "category": a.get("category"),
+                    "amount": money(a.get("amount")),
+                    "typical": money(a.get("typical")),
+                    "severity": a.get("severity"),
+                }
+                for a in largest(context.get("anomalies") or [], self.CONTEXT_MAX_ANOMALIES)
+            ],
+            "recurring_charges": [
+                {
+                    "category": r.get("category"),
+                    "amount": money(r.get("amount")),
+                    "frequency": r.get("frequency"),
+                    "is_gray_charge": r.get("is_gray_charge"),
+                }
+                for r in largest(context.get("recurring_charges") or [], self.CONTEXT_MAX_RECURRING)
+            ],
+            "gray_charges_total": money(context.get("gray_charges_total")),
+            "deltas": [
+                {
+                    "category": d.get("category"),
+                    "change_percent": money(d.get("change_percent")),
+                    "current": money(d.get("current")),
+                    "previous": money(d.get("previous")),
+                }
+                for d in largest(
+                    context.get("deltas") or [], self.CONTEXT_MAX_DELTAS, key="change_percent"
+                )
+            ],
+            "transaction_count": context.get("transaction_count"),
+        }
+
+    def _build_insights_request(self, context: dict) -> dict:
+        """
+        Build the chat completion payload for insight generation.
+
+        The system message and output schema (strict response_format, or the
+        tool schema on models without structured outputs) are shared module
+        constants; all per-user data goes in the trailing user message.
+        """
+        compact = _json_dumps(self._shrink_context(context))
+        metrics.gauge(
+            "ai_insights.context_ratio", len(compact) / max(1, len(_json_dumps(context)))
+        )
+
+        request = {
+            "messages": [
+                _INSIGHTS_SYSTEM_MESSAGE,
+                {
+                    "role": "user",
+                    "content": f"Analyze this financial data and generate insights:\n{compact}",
+                },
+            ],
+        }
+        if self.structured_outputs:
+            request["response_format"] = _INSIGHTS_RESPONSE_FORMAT
+        else:
+            request["tools"] = _INSIGHTS_TOOLS
+            request["tool_choice"] = _INSIGHTS_TOOL_CHOICE
+        return request
+
     async def generate_goal_advice(
         self, context: dict, target_amount: float, suggested_cuts: list[dict]
     ) -> str:
@@ -381,9 +956,12 @@ Generate 4-6 insights covering:
         if not self.client:
             return "Focus on reducing non-essential spending first. Small changes add up over time!"
 
-        try:
-            response = await self.client.chat.completions.create(
-                model=self.model,
+        async def request() -> str:
+            # Short 2-3 sentence reply: the lite model is plenty and far cheaper
+            response = await self._call_with_retry(
+                model=self.model_lite,
+                max_tokens=120,
+                temperature=0.6,
                 messages=[
                     {
                         "role": "system",
@@ -392,8 +970,8 @@ Generate 4-6 insights covering:
                     {
                         "role": "user",
                         "content": f"""User wants to save ${target_amount:.2f}/month.
-Current spending summary: {json.dumps(context, indent=2)}
-Suggested cuts: {json.dumps(suggested_cuts, indent=2)}
+Current spending summary: {_json_dumps(context)}
+Suggested cuts: {_json_dumps(suggested_cuts)}
 
 Give 2-3 sentences of encouraging, practical advice.""",
                     },
@@ -401,10 +979,52 @@ Give 2-3 sentences of encouraging, practical advice.""",
                 timeout=20,
             )
             return response.choices[0].message.content
+
+        try:
+            return await self._cached(
+                "goal_advice",
+                {
+                    "model": self.model_lite,
+                    "context": context,
+                    "target_amount": target_amount,
+                    "suggested_cuts": suggested_cuts,
+                },
+                request,
+            )
         except Exception as e:
             print(f"AI goal advice error: {e}")
             return "Focus on reducing non-essential spending first. Small changes add up over time!"
 
+    def _largest_spending_category(
+        self, categories: dict[str, dict]
+    ) -> Optional[tuple[str, float]]:
+        """
+        Find the spending category (negative amount) with the largest outflow.
+
+        Aggregated ledgers can carry hundreds of categories; past
+        FALLBACK_VECTORIZE_MIN_CATEGORIES a single pandas reduction replaces
+        the Python scan. Small inputs skip the DataFrame overhead.
+        """
+        if len(categories) > self.FALLBACK_VECTORIZE_MIN_CATEGORIES:
+            import pandas as pd
+
+            amounts = pd.Series(
+                {name: data.get("amount", 0) for name, data in categories.items()},
+                dtype="float64",
+            )
+            spending = amounts[amounts < 0]
+            if spending.empty:
+                return None
+            name = spending.idxmin()
+            return name, categories[name].get("amount", 0)
+
+        largest = None
+        for name, data in categories.items():
+            amount = data.get("amount", 0)
+            if amount < 0 and (largest is None or amount < largest[1]):
+                largest = (name, amount)
+        return largest
+
     def _fallback_insights(self, context: dict) -> list[dict]:
         """Generate basic insights without AI if API fails."""
         insights = []
@@ -412,25 +1032,19 @@ Give 2-3 sentences of encouraging, practical advice.""",
 
         # Basic spending insight
         if summary.get("by_category"):
-            categories = summary["by_category"]
-            # Filter to spending categories only (negative amounts)
-            spending_cats = {k: v for k,
-                             v in categories.items() if v.get("amount", 0) < 0}
-
-            if spending_cats:
-                largest = max(
-                    spending_cats.items(), key=lambda x: abs(x[1].get("amount", 0))
-                )
+            largest = self._largest_spending_category(summary["by_category"])
+            if largest:
+                name, amount = largest
                 insights.append(
                     {
                         "type": "spending",
                         "priority": 1,
-                        "title": f"Largest spending: {largest[0]}",
-                        "description": f"You spent ${abs(largest[1].get('amount', 0)):.2f} on {largest[0]} this period.",
-                        "action": f"Review your {largest[0]} spending for potential savings.",
+                        "title": f"Largest spending: {name}",
+                        "description": f"You spent ${abs(amount):.2f} on {name} this period.",
+                        "action": f"Review your {name} spending for potential savings.",
                         "reasoning": "This is your highest spending category.",
                         "confidence": 0.85,
-                        "data": {"category": largest[0], "amount": largest[1].get("amount", 0)},
+                        "data": {"category": name, "amount": amount},
                     }
                 )
 
@@ -453,19 +1067,19 @@ Give 2-3 sentences of encouraging, practical advice.""",
         # Anomalies insight
         anomalies = context.get("anomalies", [])
         if anomalies:
-            high_anomalies = [
-                a for a in anomalies if a.get("severity") == "high"]
-            if high_anomalies:
+            severity_counts = Counter(a.get("severity") for a in anomalies)
+            high_count = severity_counts["high"]
+            if high_count:
                 insights.append(
                     {
                         "type": "anomaly",
                         "priority": 1,
-                        "title": f"{len(high_anomalies)} unusual transaction(s) detected",
-                        "description": f"Found {len(high_anomalies)} transactions that are significantly higher than your typical spending.",
+                        "title": f"{high_count} unusual transaction(s) detected",
+                        "description": f"Found {high_count} transactions that are significantly higher than your typical spending.",
                         "action": "Review these transactions to ensure they were intentional.",
                         "reasoning": "These transactions deviate significantly from your normal spending patterns.",
                         "confidence": 0.90,
-                        "data": {"count": len(high_anomalies)},
+                        "data": {"count": high_count},
                     }
                 )
 
@@ -505,6 +1119,24 @@ Give 2-3 sentences of encouraging, practical advice.""",
 
         return insights
 
+    async def prewarm(self) -> bool:
+        """
+        Open a pooled connection to OpenAI before the first user request.
+
+        Pays DNS + TCP + TLS setup at startup via a cheap models.list() call.
+        Failures are logged and ignored; the app still starts.
+        """
+        if not self.client:
+            return False
+        start = time.perf_counter()
+        try:
+            await self.client.with_options(timeout=self.PREWARM_TIMEOUT).models.list()
+        except Exception as e:
+            print(f"⚠️ OpenAI prewarm failed: {e}")
+            return False
+        print(f"🔥 OpenAI connection prewarmed in {(time.perf_counter() - start) * 1000:.0f}ms")
+        return True
+
     async def check_connection(self) -> bool:
         """Check if OpenAI API is accessible."""
         if not self.client:
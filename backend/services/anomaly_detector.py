@@ -22,11 +22,17 @@ Created: 2025-01-31
 Updated: 2026-02-01 - Added sophisticated fraud detection
 """
 
+import os
+import re
+import hashlib
 import numpy as np
 import pandas as pd
+from pathlib import Path
 from typing import Optional, Set, List, Dict, Tuple
 from datetime import datetime, timedelta
-from collections import defaultdict
+from collections import OrderedDict, defaultdict
+from sqlalchemy import insert, select
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session as DBSession
 
 from models import Transaction, Anomaly, Category
@@ -49,6 +55,9 @@ MICRO_FRAUD_FREQUENCY_DAYS = 30  # Within 30 days
 VELOCITY_SPIKE_THRESHOLD = 3.0  # 3x normal transaction frequency
 CROSS_CATEGORY_SPIKE_THRESHOLD = 2.0  # 2x normal daily spending
 
+# Store numbers / transaction IDs stripped during merchant normalization
+_DIGITS_RE = re.compile(r'\d+')
+
 # ML imports with graceful fallback
 try:
     from sklearn.ensemble import IsolationForest
@@ -59,6 +68,114 @@ except ImportError:
     ML_AVAILABLE = False
     print("⚠️ scikit-learn not installed. Using statistical fallback only.")
 
+try:
+    import joblib
+except ImportError:
+    joblib = None
+
+# ONNX Runtime scoring for fitted forests (optional, falls back to sklearn)
+try:
+    from skl2onnx import to_onnx
+    import onnxruntime as ort
+    ONNX_AVAILABLE = True
+except ImportError:
+    ONNX_AVAILABLE = False
+
+# Fitted (scaler, model) pairs keyed by training data + settings, so re-running
+# analysis on the same data skips the fit. The cache is in memory only unless
+# ANOMALY_MODEL_CACHE_DIR names a directory for a disk tier, capped at the
+# MODEL_CACHE_MAX_FILES most recently used pickles. Files there are loaded
+# with joblib (pickle): point it only at a directory this app alone writes.
+MODEL_CACHE_MAX_ENTRIES = 16
+MODEL_CACHE_MAX_FILES = 64
+MODEL_CACHE_DIR = os.getenv("ANOMALY_MODEL_CACHE_DIR", "")
+_MODEL_CACHE: "OrderedDict[str, Tuple[StandardScaler, IsolationForest]]" = OrderedDict()
+_ONNX_CACHE: "OrderedDict[str, bytes]" = OrderedDict()
+
+
+# =============================================================================
+# Persistence Helpers
+# =============================================================================
+
+# Columns the ML / statistical detectors read from each transaction
+TRANSACTION_COLUMNS = ["id", "amount", "category_id", "date", "description"]
+
+
+def _load_transactions(db: DBSession, session_id: str,
+                       order_by_date: bool = False) -> list:
+    """
+    Fetch categorized transactions as lightweight rows (no ORM objects).
+
+    Rows expose id, amount, category_id, date and description as attributes,
+    and can be passed straight to pd.DataFrame(rows, columns=TRANSACTION_COLUMNS).
+    """
+    stmt = (
+        select(*(getattr(Transaction, c) for c in TRANSACTION_COLUMNS))
+        .where(Transaction.session_id == session_id,
+               Transaction.category_id.isnot(None))
+    )
+    if order_by_date:
+        stmt = stmt.order_by(Transaction.date)
+    return db.execute(stmt).all()
+
+
+def _category_names(db: DBSession) -> Dict[int, str]:
+    """Map category id -> name without hydrating Category objects."""
+    return dict(db.query(Category.id, Category.name).all())
+
+
+def _anomaly_transaction_ids(db: DBSession, session_id: str) -> Set[int]:
+    """IDs of transactions in the session that already have an anomaly."""
+    return set(db.scalars(
+        select(Anomaly.transaction_id).where(Anomaly.session_id == session_id)
+    ))
+
+
+def _dialect_name(db: DBSession) -> Optional[str]:
+    """SQL dialect name of the session's bind (e.g. 'sqlite')."""
+    return getattr(getattr(db.get_bind(), "dialect", None), "name", None)
+
+
+def _insert_anomalies(db: DBSession, rows: List[Dict]) -> int:
+    """
+    Insert anomaly rows in one executemany instead of per-row ORM adds.
+
+    Rows whose (session_id, transaction_id, anomaly_type) is already stored
+    are skipped, so re-running a detector adds nothing. SQLite/PostgreSQL
+    do this in the same statement via ON CONFLICT DO NOTHING; other
+    dialects insert row by row in savepoints and skip IntegrityErrors.
+
+    Returns:
+        Number of rows actually inserted.
+    """
+    if not rows:
+        return 0
+
+    dialect = _dialect_name(db)
+    if dialect == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert as dialect_insert
+    elif dialect == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert as dialect_insert
+    else:
+        inserted = 0
+        for row in rows:
+            try:
+                with db.begin_nested():
+                    db.execute(insert(Anomaly), row)
+            except IntegrityError:
+                continue  # Already stored
+            inserted += 1
+        return inserted
+
+    stmt = (
+        dialect_insert(Anomaly)
+        .on_conflict_do_nothing(
+            index_elements=["session_id", "transaction_id", "anomaly_type"]
+        )
+        .returning(Anomaly.transaction_id)
+    )
+    return len(db.execute(stmt, rows).all())
+
 
 # =============================================================================
 # Gradual Fraud Detector
@@ -175,10 +292,9 @@ class GradualFraudDetector:
         """Normalize merchant name for grouping."""
         if not description:
             return "UNKNOWN"
-        import re
-        text = re.sub(r'\d+', '', description.upper()).strip()
-        words = text.split()[:3]  # First 3 words
-        return ' '.join(words) if words else "UNKNOWN"
+        text = _DIGITS_RE.sub('', description.upper()).strip()
+        words = text.split(None, 3)[:3]  # First 3 words
+        return ' '.join(words) or "UNKNOWN"
 
 
 # =============================================================================
@@ -283,10 +399,9 @@ class MicroTransactionDetector:
         """Normalize merchant name."""
         if not description:
             return "UNKNOWN"
-        import re
-        text = re.sub(r'\d+', '', description.upper()).strip()
-        words = text.split()[:2]
-        return ' '.join(words) if words else "UNKNOWN"
+        text = _DIGITS_RE.sub('', description.upper()).strip()
+        words = text.split(None, 2)[:2]
+        return ' '.join(words) or "UNKNOWN"
     
     def _bucket_amount(self, amount: float) -> str:
         """Bucket amount for grouping similar charges."""
@@ -612,10 +727,9 @@ class PatternMatchingDetector:
         """Normalize merchant name."""
         if not description:
             return "UNKNOWN"
-        import re
-        text = re.sub(r'\d+', '', description.upper()).strip()
-        words = text.split()[:2]
-        return ' '.join(words) if words else "UNKNOWN"
+        text = _DIGITS_RE.sub('', description.upper()).strip()
+        words = text.split(None, 2)[:2]
+        return ' '.join(words) or "UNKNOWN"
 
 
 # =============================================================================
@@ -635,176 +749,244 @@ class MLAnomalyDetector:
         'low': 0.0
     }
 
+    FEATURE_COLUMNS = [
+        'amount_abs', 'amount_zscore', 'amount_log',
+        'merchant_frequency', 'is_one_time', 'day_of_week',
+        'is_weekend', 'is_payday', 'amount_vs_category_avg',
+        'time_since_last',
+    ]
+
     def __init__(self, db: DBSession, contamination: float = 0.05):
         self.db = db
         self.contamination = contamination
         self.model: Optional[IsolationForest] = None
         self.scaler: Optional[StandardScaler] = None
+        self._onnx_session = None
 
-    def detect(self, session_id: str) -> int:
-        """Detect anomalies using Isolation Forest."""
+    def detect(self, session_id: str, seen_ids: Optional[Set[int]] = None) -> int:
+        """
+        Detect anomalies using Isolation Forest.
+
+        Args:
+            session_id: Session to scan.
+            seen_ids: Transactions that already have an anomaly (loaded from
+                the database if omitted); they are skipped, and newly flagged
+                ones are added.
+        """
         if not ML_AVAILABLE:
             return 0
 
-        transactions = (
-            self.db.query(Transaction)
-            .filter(Transaction.session_id == session_id)
-            .filter(Transaction.category_id.isnot(None))
-            .order_by(Transaction.date)
-            .all()
-        )
+        transactions = _load_transactions(self.db, session_id, order_by_date=True)
 
         if len(transactions) < 50:
             return 0
 
-        categories = self.db.query(Category).all()
-        category_map = {c.id: c.name for c in categories}
+        category_map = _category_names(self.db)
+        txn_by_id: Dict[int, Transaction] = {t.id: t for t in transactions}
 
-        features_df = self._extract_features(transactions)
+        # Scaled in place: one float32 buffer from feature build to scoring
+        X, txn_ids, features = self._extract_feature_matrix(transactions)
 
-        if features_df.empty:
+        if len(txn_ids) == 0:
             return 0
 
         if self.model is None:
-            self._train_model(features_df)
-
-        X = features_df[['amount_abs', 'amount_zscore', 'amount_log',
-                         'merchant_frequency', 'is_one_time', 'day_of_week',
-                         'is_weekend', 'is_payday', 'amount_vs_category_avg',
-                         'time_since_last']].values
-
-        X_scaled = self.scaler.transform(X)
-        predictions = self.model.predict(X_scaled)
-        anomaly_scores = self.model.decision_function(X_scaled)
-
-        anomalies_created = 0
-        existing_anomaly_ids: Set[int] = set(
-            row[0] for row in self.db.query(Anomaly.transaction_id)
-            .filter(Anomaly.session_id == session_id)
-            .all()
-        )
-
-        for idx, (pred, score) in enumerate(zip(predictions, anomaly_scores)):
-            if pred == -1:
-                txn_id = int(features_df.iloc[idx]['transaction_id'])
-
-                if txn_id in existing_anomaly_ids:
-                    continue
-
-                txn = next((t for t in transactions if t.id == txn_id), None)
-
-                if txn is None or abs(txn.amount) > MAX_AMOUNT_FOR_ANALYSIS:
-                    continue
-
-                severity = self._score_to_severity(score)
-                confidence = min(self._score_to_confidence(score), 1.0)
-                category_name = category_map.get(txn.category_id, "Unknown")
+            X_scaled = self._train_model(X)
+        else:
+            X_scaled = self.scaler.transform(X, copy=False)
+        anomaly_scores = self._decision_scores(X_scaled)
+        # predict() flags rows whose decision score is negative
+        predictions = np.where(anomaly_scores < 0, -1, 1)
+
+        rows: List[Dict] = []
+        if seen_ids is None:
+            seen_ids = _anomaly_transaction_ids(self.db, session_id)
+
+        # Score only the flagged rows, in bulk
+        mask = predictions == -1
+        confidences = self._scores_to_confidence(anomaly_scores[mask])
+        severities = self._confidences_to_severity(confidences)
+        mean_amount = float(features['amount_abs'].mean())
+
+        for txn_id, amount_zscore, is_one_time, merchant_frequency, confidence, severity in zip(
+            txn_ids[mask].tolist(),
+            features['amount_zscore'][mask].tolist(),
+            features['is_one_time'][mask].tolist(),
+            features['merchant_frequency'][mask].tolist(),
+            confidences.tolist(),
+            severities.tolist(),
+        ):
+            if txn_id in seen_ids:
+                continue
 
-                explanation = self._generate_ml_explanation(
-                    txn=txn,
-                    category_name=category_name,
-                    confidence=confidence,
-                    features=features_df.iloc[idx]
-                )
+            txn = txn_by_id.get(txn_id)
 
-                anomaly = Anomaly(
-                    session_id=session_id,
-                    transaction_id=txn_id,
-                    anomaly_type="ml_isolation_forest",
-                    severity=severity,
-                    expected_value=features_df['amount_abs'].mean(),
-                    actual_value=abs(txn.amount),
-                    z_score=confidence,
-                    explanation=explanation,
-                )
-                self.db.add(anomaly)
-                existing_anomaly_ids.add(txn_id)
-                anomalies_created += 1
+            if txn is None or abs(txn.amount) > MAX_AMOUNT_FOR_ANALYSIS:
+                continue
 
+            category_name = category_map.get(txn.category_id, "Unknown")
+
+            explanation = self._generate_ml_explanation(
+                txn=txn,
+                category_name=category_name,
+                confidence=confidence,
+                amount_zscore=amount_zscore,
+                is_one_time=is_one_time,
+                merchant_frequency=merchant_frequency,
+            )
+
+            rows.append(dict(
+                session_id=session_id,
+                transaction_id=txn_id,
+                anomaly_type="ml_isolation_forest",
+                severity=severity,
+                expected_value=mean_amount,
+                actual_value=abs(txn.amount),
+                z_score=confidence,
+                explanation=explanation,
+            ))
+            seen_ids.add(txn_id)
+
+        anomalies_created = _insert_anomalies(self.db, rows)
         self.db.commit()
         return anomalies_created
 
-    def _extract_features(self, transactions: list) -> pd.DataFrame:
-        """Extract enhanced features for ML model."""
-        if not transactions:
-            return pd.DataFrame()
-
-        data = []
-        prev_date = None
-        
-        for t in transactions:
-            txn_date = t.date
-            day_of_week = txn_date.weekday() if hasattr(txn_date, 'weekday') else 0
-            day_of_month = txn_date.day if hasattr(txn_date, 'day') else 1
-            
-            # Calculate time since last transaction
-            if prev_date and hasattr(txn_date, 'toordinal'):
-                time_since_last = (txn_date - prev_date).days
-            else:
-                time_since_last = 1
-            prev_date = txn_date
-
-            data.append({
-                'transaction_id': t.id,
-                'amount': abs(t.amount),
-                'category_id': t.category_id,
-                'date': txn_date,
-                'description': t.description.upper() if t.description else '',
-                'day_of_week': day_of_week,
-                'day_of_month': day_of_month,
-                'time_since_last': max(0, min(time_since_last, 30)),  # Cap at 30 days
-            })
-
-        df = pd.DataFrame(data)
-
-        # Basic features
-        df['amount_abs'] = df['amount']
+    def _extract_feature_matrix(
+        self, transactions: list
+    ) -> Tuple[np.ndarray, np.ndarray, Dict[str, np.ndarray]]:
+        """
+        Build the model input straight from transaction rows, without a DataFrame.
 
-        amount_mean = df['amount'].mean()
-        amount_std = df['amount'].std()
-        df['amount_zscore'] = (df['amount'] - amount_mean) / (amount_std if amount_std > 0 else 1)
+        IsolationForest trees work in float32 internally, so X is filled
+        column by column into one C-contiguous float32 buffer.
 
-        df['amount_log'] = np.log1p(df['amount'])
+        Returns:
+            X: Feature matrix, columns in FEATURE_COLUMNS order.
+            txn_ids: Transaction IDs (int64) aligned with the rows of X.
+            features: Per-row columns keyed by name, for explanations and
+                _extract_features.
+        """
+        n = len(transactions)
+        if n == 0:
+            return (np.empty((0, len(self.FEATURE_COLUMNS)), dtype=np.float32),
+                    np.empty(0, dtype=np.int64), {})
+
+        # One pass over the rows, filling preallocated columns (SoA)
+        ids = np.empty(n, dtype=np.int64)
+        amounts = np.empty(n, dtype=np.float64)
+        category_ids: list = [None] * n
+        raw_dates: list = [None] * n
+        descriptions: list = [None] * n
+        for i, t in enumerate(transactions):
+            ids[i] = t.id
+            amounts[i] = abs(t.amount)
+            category_ids[i] = t.category_id
+            raw_dates[i] = t.date
+            descriptions[i] = t.description.upper() if t.description else ''
+
+        dates = pd.to_datetime(raw_dates)
+        day_of_week = dates.dayofweek.to_numpy()
+        day_of_month = dates.day.to_numpy()
+
+        # Days since previous transaction (first row defaults to 1), capped at 30
+        time_since_last = np.ones(n, dtype=np.int64)
+        time_since_last[1:] = np.diff(dates.to_numpy()) // np.timedelta64(1, 'D')
+        np.clip(time_since_last, 0, 30, out=time_since_last)
+
+        amount_std = amounts.std(ddof=1) if n > 1 else 0.0
+        amount_zscore = (amounts - amounts.mean()) / (amount_std if amount_std > 0 else 1)
 
         # Merchant features
-        df['merchant_norm'] = df['description'].apply(self._normalize_merchant)
-        merchant_counts = df['merchant_norm'].value_counts()
-        total_txns = len(df)
-        df['merchant_frequency'] = df['merchant_norm'].map(
-            lambda m: merchant_counts.get(m, 1) / total_txns
-        )
-        df['is_one_time'] = df['merchant_norm'].map(
-            lambda m: 1 if merchant_counts.get(m, 0) <= 2 else 0
-        )
-
-        # Temporal features
-        df['is_weekend'] = (df['day_of_week'] >= 5).astype(int)
-        df['is_payday'] = ((df['day_of_month'] <= 3) |
-                           ((df['day_of_month'] >= 15) & (df['day_of_month'] <= 17))).astype(int)
+        merchant_norm = [self._normalize_merchant(d) for d in descriptions]
+        merchant_codes, _ = pd.factorize(np.asarray(merchant_norm, dtype=object))
+        merchant_counts = np.bincount(merchant_codes)[merchant_codes]
 
         # Category-relative features
-        category_means = df.groupby('category_id')['amount'].transform('mean')
-        df['amount_vs_category_avg'] = df['amount'] / category_means.replace(0, 1)
+        category_codes, _ = pd.factorize(np.asarray(category_ids, dtype=object),
+                                         use_na_sentinel=False)
+        category_means = (np.bincount(category_codes, weights=amounts)
+                          / np.bincount(category_codes))[category_codes]
+        category_means[category_means == 0] = 1
+
+        features = {
+            'amount_abs': amounts,
+            'amount_zscore': amount_zscore,
+            'amount_log': np.log1p(amounts),
+            'merchant_frequency': merchant_counts / n,
+            'is_one_time': (merchant_counts <= 2).astype(int),
+            'day_of_week': day_of_week,
+            'is_weekend': (day_of_week >= 5).astype(int),
+            'is_payday': ((day_of_month <= 3) |
+                          ((day_of_month >= 15) & (day_of_month <= 17))).astype(int),
+            'amount_vs_category_avg': amounts / category_means,
+            'time_since_last': time_since_last,
+            'category_id': category_ids,
+            'date': raw_dates,
+            'description': descriptions,
+            'day_of_month': day_of_month,
+            'merchant_norm': merchant_norm,
+        }
+
+        X = np.empty((n, len(self.FEATURE_COLUMNS)), dtype=np.float32)
+        for j, column in enumerate(self.FEATURE_COLUMNS):
+            X[:, j] = features[column]
+
+        return X, ids, features
 
-        return df
+    def _extract_features(self, transactions: list) -> pd.DataFrame:
+        """Extract enhanced features for ML model, as a DataFrame."""
+        _, ids, f = self._extract_feature_matrix(transactions)
+        if len(ids) == 0:
+            return pd.DataFrame()
+
+        return pd.DataFrame({
+            'transaction_id': ids,
+            'amount': f['amount_abs'],
+            'category_id': f['category_id'],
+            'date': f['date'],
+            'description': pd.Series(f['description'], dtype=object),
+            'day_of_week': f['day_of_week'],
+            'day_of_month': f['day_of_month'],
+            'time_since_last': f['time_since_last'],
+            'amount_abs': f['amount_abs'],
+            'amount_zscore': f['amount_zscore'],
+            'amount_log': f['amount_log'],
+            'merchant_norm': pd.Series(f['merchant_norm'], dtype=object),
+            'merchant_frequency': f['merchant_frequency'],
+            'is_one_time': f['is_one_time'],
+            'is_weekend': f['is_weekend'],
+            'is_payday': f['is_payday'],
+            'amount_vs_category_avg': f['amount_vs_category_avg'],
+        })
 
     def _normalize_merchant(self, description: str) -> str:
         """Normalize merchant name."""
         if not description:
             return "UNKNOWN"
-        import re
-        text = re.sub(r'\d+', '', description).strip()
-        words = text.split()[:2]
-        return ' '.join(words) if words else "UNKNOWN"
-
-    def _train_model(self, features_df: pd.DataFrame) -> None:
-        """Train Isolation Forest model."""
-        X = features_df[['amount_abs', 'amount_zscore', 'amount_log',
-                         'merchant_frequency', 'is_one_time', 'day_of_week',
-                         'is_weekend', 'is_payday', 'amount_vs_category_avg',
-                         'time_since_last']].values
-
-        self.scaler = StandardScaler()
+        text = _DIGITS_RE.sub('', description).strip()
+        words = text.split(None, 2)[:2]
+        return ' '.join(words) or "UNKNOWN"
+
+    def _train_model(self, X: np.ndarray) -> np.ndarray:
+        """
+        Train Isolation Forest model (or reuse one fitted on identical data).
+
+        Args:
+            X: Feature matrix from _extract_feature_matrix; it is scaled in place.
+
+        Returns:
+            The scaled matrix (the same buffer as X).
+        """
+        key = self._model_cache_key(X)
+        cached = self._load_cached_model(key)
+        if cached is not None:
+            self.scaler, self.model = cached
+            print(f"♻️ Reusing cached Isolation Forest for {len(X)} transactions")
+            X_scaled = self.scaler.transform(X, copy=False)
+            self._onnx_session = self._onnx_session_for(key, X_scaled)
+            return X_scaled
+
+        self.scaler = StandardScaler(copy=False)
         X_scaled = self.scaler.fit_transform(X)
 
         self.model = IsolationForest(
@@ -817,28 +999,133 @@ class MLAnomalyDetector:
         self.model.fit(X_scaled)
         print(f"✅ Trained Isolation Forest on {len(X)} transactions")
 
+        self._store_cached_model(key, (self.scaler, self.model))
+        self._onnx_session = self._onnx_session_for(key, X_scaled)
+        return X_scaled
+
+    def _decision_scores(self, X_scaled: np.ndarray) -> np.ndarray:
+        """
+        decision_function equivalent from a single pass over the trees.
+
+        Uses the compiled ONNX Runtime graph when available; otherwise
+        sklearn's score_samples - offset_.
+        """
+        if self._onnx_session is not None:
+            try:
+                feed = {self._onnx_session.get_inputs()[0].name: X_scaled.astype(np.float32, copy=False)}
+                _, scores = self._onnx_session.run(None, feed)
+                return np.asarray(scores, dtype=np.float64).ravel()
+            except Exception as e:
+                print(f"⚠️ ONNX scoring failed, using scikit-learn: {e}")
+                self._onnx_session = None
+        return self.model.score_samples(X_scaled) - self.model.offset_
+
+    def _onnx_session_for(self, key: str, X_scaled: np.ndarray):
+        """Convert the fitted forest to ONNX (cached by model key) and open a session."""
+        if not ONNX_AVAILABLE:
+            return None
+        onnx_bytes = _ONNX_CACHE.get(key)
+        try:
+            if onnx_bytes is None:
+                onnx_bytes = to_onnx(
+                    self.model, X_scaled[:1], target_opset={'': 15, 'ai.onnx.ml': 3}
+                ).SerializeToString()
+                _ONNX_CACHE[key] = onnx_bytes
+                while len(_ONNX_CACHE) > MODEL_CACHE_MAX_ENTRIES:
+                    _ONNX_CACHE.popitem(last=False)
+            return ort.InferenceSession(onnx_bytes, providers=['CPUExecutionProvider'])
+        except Exception as e:
+            print(f"⚠️ ONNX conversion unavailable, using scikit-learn: {e}")
+            return None
+
+    def _model_cache_key(self, X: np.ndarray) -> str:
+        """Hash of the training matrix, its shape/dtype and model settings."""
+        import sklearn
+
+        digest = hashlib.blake2b(digest_size=16)
+        # Hash the array buffer in place (no tobytes() copy)
+        digest.update(memoryview(np.ascontiguousarray(X)).cast('B'))
+        digest.update(f"{X.shape}|{X.dtype}|{self.contamination}|{sklearn.__version__}".encode())
+        return digest.hexdigest()
+
+    def _load_cached_model(self, key: str) -> Optional["Tuple[StandardScaler, IsolationForest]"]:
+        """Look up a fitted pair in memory, then on disk."""
+        cached = _MODEL_CACHE.get(key)
+        if cached is not None:
+            _MODEL_CACHE.move_to_end(key)
+            return cached
+
+        if not MODEL_CACHE_DIR or joblib is None:
+            return None
+        path = Path(MODEL_CACHE_DIR) / f"iforest_{key}.pkl"
+        if not path.exists():
+            return None
+        try:
+            cached = joblib.load(path)
+            os.utime(path)  # Mark as recently used for eviction
+        except Exception as e:
+            print(f"⚠️ Ignoring unreadable model cache {path.name}: {e}")
+            return None
+        self._remember_model(key, cached)
+        return cached
+
+    def _store_cached_model(self, key: str, pair: "Tuple[StandardScaler, IsolationForest]") -> None:
+        """Keep a fitted pair in memory and, if enabled, on disk."""
+        self._remember_model(key, pair)
+
+        if not MODEL_CACHE_DIR or joblib is None:
+            return
+        try:
+            cache_dir = Path(MODEL_CACHE_DIR)
+            cache_dir.mkdir(parents=True, exist_ok=True)
+            joblib.dump(pair, cache_dir / f"iforest_{key}.pkl")
+            self._evict_cached_files(cache_dir)
+        except OSError as e:
+            print(f"⚠️ Could not write model cache: {e}")
+
+    def _evict_cached_files(self, cache_dir: Path) -> None:
+        """Delete least recently used pickles beyond MODEL_CACHE_MAX_FILES."""
+        files = sorted(cache_dir.glob("iforest_*.pkl"), key=lambda f: f.stat().st_mtime)
+        for stale in files[:max(0, len(files) - MODEL_CACHE_MAX_FILES)]:
+            stale.unlink(missing_ok=True)
+
+    def _remember_model(self, key: str, pair: "Tuple[StandardScaler, IsolationForest]") -> None:
+        _MODEL_CACHE[key] = pair
+        _MODEL_CACHE.move_to_end(key)
+        while len(_MODEL_CACHE) > MODEL_CACHE_MAX_ENTRIES:
+            _MODEL_CACHE.popitem(last=False)
+
     def _score_to_severity(self, score: float) -> str:
-        """Convert anomaly score to severity."""
-        confidence = self._score_to_confidence(score)
-        if confidence >= self.SEVERITY_THRESHOLDS['high']:
-            return 'high'
-        elif confidence >= self.SEVERITY_THRESHOLDS['medium']:
-            return 'medium'
-            return 'low'
+        """Convert a single anomaly score to severity."""
+        confidences = self._scores_to_confidence(np.array([score]))
+        return str(self._confidences_to_severity(confidences)[0])
 
     def _score_to_confidence(self, score: float) -> float:
-        """Convert anomaly score to confidence."""
-        confidence = max(0.0, min(1.0, (0.0 - score) * 2))
-        return round(confidence, 3)
+        """Convert a single anomaly score to confidence."""
+        return float(self._scores_to_confidence(np.array([score]))[0])
+
+    def _scores_to_confidence(self, scores: np.ndarray) -> np.ndarray:
+        """Convert decision scores to confidences in [0, 1] (more negative = higher)."""
+        return np.clip(-np.asarray(scores, dtype=np.float64) * 2, 0.0, 1.0).round(3)
+
+    def _confidences_to_severity(self, confidences: np.ndarray) -> np.ndarray:
+        """Map confidences to 'high' / 'medium' / 'low' via SEVERITY_THRESHOLDS."""
+        return np.select(
+            [confidences >= self.SEVERITY_THRESHOLDS['high'],
+             confidences >= self.SEVERITY_THRESHOLDS['medium']],
+            ['high', 'medium'],
+            default='low',
+        )
 
-    def _generate_ml_explanation(self, txn, category_name: str, 
-                                  confidence: float, features: pd.Series) -> str:
+    def _generate_ml_explanation(self, txn, category_name: str,
+                                  confidence: float, amount_zscore: float,
+                                  is_one_time: int, merchant_frequency: float) -> str:
         """Generate explanation for ML-detected anomaly."""
         amount = abs(txn.amount)
         is_income = txn.amount > 0
-        is_high = features['amount_zscore'] > 2.0
-        is_low = features['amount_zscore'] < -1.5
-        is_rare_merchant = features['is_one_time'] == 1 or features['merchant_frequency'] < 0.02
+        is_high = amount_zscore > 2.0
+        is_low = amount_zscore < -1.5
+        is_rare_merchant = is_one_time == 1 or merchant_frequency < 0.02
 
         if is_income:
             if is_high:
@@ -891,47 +1178,33 @@ class AnomalyDetector:
         Returns:
             Total number of anomalies detected.
         """
-        transactions = (
-            self.db.query(Transaction)
-            .filter(Transaction.session_id == session_id)
-            .filter(Transaction.category_id.isnot(None))
-            .all()
-        )
+        transactions = _load_transactions(self.db, session_id)
 
         if len(transactions) < 3:
             return 0
 
         total_anomalies = 0
-        
-        # Get existing anomaly transaction IDs
-        existing_anomaly_ids: Set[int] = set(
-            row[0] for row in self.db.query(Anomaly.transaction_id)
-            .filter(Anomaly.session_id == session_id)
-            .all()
-        )
+        rows: List[Dict] = []
+
+        # One anomaly per transaction: every pass skips transactions already
+        # flagged by a previous run or an earlier pass
+        seen_ids = _anomaly_transaction_ids(self.db, session_id)
 
         # 1. Run ML or statistical detection
         if len(transactions) >= 50 and self.ml_detector is not None:
             print(f"🤖 Running ML anomaly detection ({len(transactions)} transactions)")
-            total_anomalies += self.ml_detector.detect(session_id)
+            total_anomalies += self.ml_detector.detect(session_id, seen_ids)
         else:
             print(f"📊 Running statistical detection ({len(transactions)} transactions)")
-            total_anomalies += self._detect_statistical(session_id, transactions)
-
-        # Refresh existing IDs after first pass
-        existing_anomaly_ids = set(
-            row[0] for row in self.db.query(Anomaly.transaction_id)
-            .filter(Anomaly.session_id == session_id)
-            .all()
-        )
+            total_anomalies += self._detect_statistical(session_id, transactions, seen_ids)
 
         # 2. Gradual fraud detection
         print("🔍 Checking for gradual fraud patterns...")
         gradual_detections = self.gradual_detector.detect(session_id)
         for detection in gradual_detections:
             txn_id = detection['latest_transaction_id']
-            if txn_id not in existing_anomaly_ids:
-                anomaly = Anomaly(
+            if txn_id not in seen_ids:
+                rows.append(dict(
                     session_id=session_id,
                     transaction_id=txn_id,
                     anomaly_type="gradual_fraud",
@@ -940,18 +1213,16 @@ class AnomalyDetector:
                     actual_value=detection['last_amount'],
                     z_score=detection['pct_increase'] / 100,
                     explanation=detection['explanation'],
-                )
-                self.db.add(anomaly)
-                existing_anomaly_ids.add(txn_id)
-                total_anomalies += 1
+                ))
+                seen_ids.add(txn_id)
 
         # 3. Micro-transaction fraud detection
         print("🔍 Checking for micro-transaction fraud...")
         micro_detections = self.micro_detector.detect(session_id)
         for detection in micro_detections:
             txn_id = detection['latest_transaction_id']
-            if txn_id not in existing_anomaly_ids:
-                anomaly = Anomaly(
+            if txn_id not in seen_ids:
+                rows.append(dict(
                     session_id=session_id,
                     transaction_id=txn_id,
                     anomaly_type="micro_fraud",
@@ -960,10 +1231,8 @@ class AnomalyDetector:
                     actual_value=detection['monthly_drain'],
                     z_score=detection['charges_per_week'],
                     explanation=detection['explanation'],
-                )
-                self.db.add(anomaly)
-                existing_anomaly_ids.add(txn_id)
-                total_anomalies += 1
+                ))
+                seen_ids.add(txn_id)
 
         # 4. Cross-category spike detection
         print("🔍 Checking for cross-category spending spikes...")
@@ -971,8 +1240,8 @@ class AnomalyDetector:
         for detection in spike_detections[:3]:  # Top 3 spikes
             # Use first transaction from the spike day
             txn_id = detection['transaction_ids'][0]
-            if txn_id not in existing_anomaly_ids:
-                anomaly = Anomaly(
+            if txn_id not in seen_ids:
+                rows.append(dict(
                     session_id=session_id,
                     transaction_id=txn_id,
                     anomaly_type="cross_category_spike",
@@ -981,18 +1250,16 @@ class AnomalyDetector:
                     actual_value=detection['total_spending'],
                     z_score=detection['z_score'],
                     explanation=detection['explanation'],
-                )
-                self.db.add(anomaly)
-                existing_anomaly_ids.add(txn_id)
-                total_anomalies += 1
+                ))
+                seen_ids.add(txn_id)
 
         # 5. Velocity detection
         print("🔍 Checking for velocity anomalies...")
         velocity_detections = self.velocity_detector.detect(session_id)
         for detection in velocity_detections[:2]:  # Top 2 velocity spikes
             txn_id = detection['transaction_ids'][0]
-            if txn_id not in existing_anomaly_ids:
-                anomaly = Anomaly(
+            if txn_id not in seen_ids:
+                rows.append(dict(
                     session_id=session_id,
                     transaction_id=txn_id,
                     anomaly_type="velocity_spike",
@@ -1001,18 +1268,16 @@ class AnomalyDetector:
                     actual_value=detection['transaction_count'],
                     z_score=detection['z_score'],
                     explanation=detection['explanation'],
-                )
-                self.db.add(anomaly)
-                existing_anomaly_ids.add(txn_id)
-                total_anomalies += 1
+                ))
+                seen_ids.add(txn_id)
 
         # 6. Pattern matching (sophisticated fraud)
         print("🔍 Checking for sophisticated fraud patterns...")
         pattern_detections = self.pattern_detector.detect(session_id)
         for detection in pattern_detections[:3]:  # Top 3 patterns
             txn_id = detection['transaction_ids'][0]
-            if txn_id not in existing_anomaly_ids:
-                anomaly = Anomaly(
+            if txn_id not in seen_ids:
+                rows.append(dict(
                     session_id=session_id,
                     transaction_id=txn_id,
                     anomaly_type=detection['type'],
@@ -1021,89 +1286,75 @@ class AnomalyDetector:
                     actual_value=detection.get('amount', 0) or detection.get('total', 0),
                     z_score=0.5,
                     explanation=detection['explanation'],
-                )
-                self.db.add(anomaly)
-                existing_anomaly_ids.add(txn_id)
-                total_anomalies += 1
+                ))
+                seen_ids.add(txn_id)
 
+        total_anomalies += _insert_anomalies(self.db, rows)
         self.db.commit()
         print(f"✅ Total anomalies detected: {total_anomalies}")
         return total_anomalies
 
-    def _detect_statistical(self, session_id: str, transactions: list) -> int:
-        """Statistical z-score based anomaly detection."""
-        categories = self.db.query(Category).all()
-        category_map = {c.id: c.name for c in categories}
-
-        data = [
-            {
-                "id": t.id,
-                "amount": t.amount,
-                "category_id": t.category_id,
-                "date": t.date,
-                "description": t.description,
-            }
-            for t in transactions
-        ]
-        df = pd.DataFrame(data)
-        df = df[df['amount'].abs() <= MAX_AMOUNT_FOR_ANALYSIS]
-
-        existing_anomaly_ids: Set[int] = set(
-            row[0] for row in self.db.query(Anomaly.transaction_id)
-            .filter(Anomaly.session_id == session_id)
-            .all()
-        )
-
-        anomalies_created = 0
-
-        for category_id in df["category_id"].unique():
-            cat_df = df[(df["category_id"] == category_id) & (df["amount"] < 0)]
-
-            if len(cat_df) < MIN_TRANSACTIONS_FOR_ZSCORE:
-                continue
+    def _detect_statistical(self, session_id: str, transactions: list,
+                            seen_ids: Optional[Set[int]] = None) -> int:
+        """Statistical z-score based anomaly detection (skips `seen_ids`)."""
+        if seen_ids is None:
+            seen_ids = _anomaly_transaction_ids(self.db, session_id)
+        category_map = _category_names(self.db)
 
-            mean = cat_df["amount"].mean()
-            std = cat_df["amount"].std()
+        df = pd.DataFrame(transactions, columns=TRANSACTION_COLUMNS)
+        df = df[df['amount'].abs() <= MAX_AMOUNT_FOR_ANALYSIS]
 
-            if std == 0 or pd.isna(std) or std < 0.01:
+        rows: List[Dict] = []
+
+        # Per-category z-scores over spending rows, computed in one pass
+        category_order = {cid: i for i, cid in enumerate(df["category_id"].unique())}
+        spend = df[df["amount"] < 0]
+        by_category = spend.groupby("category_id")["amount"]
+        mean = by_category.transform("mean")
+        std = by_category.transform("std")
+        count = by_category.transform("size")
+
+        scorable = (count >= MIN_TRANSACTIONS_FOR_ZSCORE) & (std >= 0.01)
+        z_abs = (
+            (spend["amount"] - mean) / std.where(scorable)  # NaN, not inf, when std ~ 0
+        ).clip(-MAX_ZSCORE, MAX_ZSCORE).abs()
+        flagged = scorable & (z_abs > 2)
+
+        hits = spend.loc[flagged, ["id", "category_id", "amount"]].assign(
+            mean=mean[flagged],
+            z_abs=z_abs[flagged],
+            rank=spend.loc[flagged, "category_id"].map(category_order),
+        ).sort_values("rank", kind="stable")
+        severities = self._get_severities(hits["z_abs"].to_numpy())
+
+        for row, severity in zip(hits.itertuples(index=False), severities.tolist()):
+            txn_id = int(row.id)
+            if txn_id in seen_ids:
                 continue
-
-            for _, row in cat_df.iterrows():
-                txn_id = row["id"]
-
-                if txn_id in existing_anomaly_ids:
-                    continue
-
-                z_score = (row["amount"] - mean) / std
-                z_score_bounded = np.clip(z_score, -MAX_ZSCORE, MAX_ZSCORE)
-
-                if abs(z_score_bounded) > 2:
-                    severity = self._get_severity(abs(z_score_bounded))
-                    category_name = category_map.get(category_id, "Unknown")
-                    confidence = min(1.0, abs(z_score_bounded) / 5.0)
-
-                    explanation = self._generate_explanation(
-                        category_name,
-                        abs(row["amount"]),
-                        abs(mean),
-                        abs(z_score_bounded),
-                        is_income=row["amount"] > 0,
-                    )
-
-                    anomaly = Anomaly(
-                        session_id=session_id,
-                        transaction_id=txn_id,
-                        anomaly_type="amount",
-                        severity=severity,
-                        expected_value=abs(mean),
-                        actual_value=abs(row["amount"]),
-                        z_score=confidence,
-                        explanation=explanation,
-                    )
-                    self.db.add(anomaly)
-                    existing_anomaly_ids.add(txn_id)
-                    anomalies_created += 1
-
+            category_name = category_map.get(row.category_id, "Unknown")
+            confidence = min(1.0, row.z_abs / 5.0)
+
+            explanation = self._generate_explanation(
+                category_name,
+                abs(row.amount),
+                abs(row.mean),
+                row.z_abs,
+                is_income=row.amount > 0,
+            )
+
+            rows.append(dict(
+                session_id=session_id,
+                transaction_id=txn_id,
+                anomaly_type="amount",
+                severity=severity,
+                expected_value=abs(row.mean),
+                actual_value=abs(row.amount),
+                z_score=confidence,
+                explanation=explanation,
+            ))
+            seen_ids.add(txn_id)
+
+        anomalies_created = _insert_anomalies(self.db, rows)
         self.db.commit()
         return anomalies_created
 
@@ -1113,7 +1364,12 @@ class AnomalyDetector:
             return "high"
         elif z_score_abs > 2.5:
             return "medium"
-            return "low"
+        return "low"
+
+    def _get_severities(self, z_scores_abs: np.ndarray) -> np.ndarray:
+        """Vectorized _get_severity."""
+        return np.where(z_scores_abs > 3, "high",
+                        np.where(z_scores_abs > 2.5, "medium", "low"))
 
     def _generate_explanation(self, category: str, actual: float, expected: float,
                               z_score_abs: float, is_income: bool = False) -> str:
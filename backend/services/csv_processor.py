@@ -11,17 +11,41 @@ Validates:
 Author: Smart Financial Coach Team
 """
 
+import asyncio
+import multiprocessing
+import os
 import uuid
 import re
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime, date
-from io import StringIO
+from io import BytesIO
 from typing import Optional, List, Dict
 import pandas as pd
 from fastapi import UploadFile
+from sqlalchemy import insert
 from sqlalchemy.orm import Session as DBSession
 
 from models import Session, Transaction
 
+# Optional: Arrow's multithreaded CSV reader
+try:
+    import pyarrow as pa
+    from pyarrow import csv as pa_csv
+    PYARROW_AVAILABLE = True
+except ImportError:
+    PYARROW_AVAILABLE = False
+
+# Uploads at least this large are parsed in a worker process. The pool starts
+# on the first such upload, so small deployments never spawn a worker.
+PARSE_OFFLOAD_MIN_BYTES = int(os.getenv("PARSE_OFFLOAD_MIN_BYTES", str(256 * 1024)))
+PARSE_WORKERS = max(1, int(os.getenv("PARSE_WORKERS", "1")))
+
+_parse_pool: Optional[ProcessPoolExecutor] = None
+
+_AMOUNT_STRIP_RE = re.compile(r"[$,]")
+_WHITESPACE_RE = re.compile(r"\s+")
+_DESCRIPTION_PREFIX_RE = re.compile(r"^(POS |CHECKCARD |DEBIT |CREDIT )", re.I)
+
 
 class DataValidationError(ValueError):
     """Exception for data validation failures."""
@@ -30,6 +54,10 @@ class DataValidationError(ValueError):
         super().__init__(message)
         self.warnings = warnings or []
 
+    def __reduce__(self):
+        # Keep warnings when raised in a parse worker process
+        return type(self), (str(self), self.warnings)
+
 
 class CSVProcessor:
     """Parse, validate, and normalize transaction CSVs with sanity checks."""
@@ -66,35 +94,16 @@ class CSVProcessor:
         
         # Read file content
         content = await file.read()
-        try:
-            text = content.decode("utf-8")
-        except UnicodeDecodeError:
-            text = content.decode("latin-1")
-
-        df = pd.read_csv(StringIO(text))
-        
-        # Check row count
-        if len(df) > self.MAX_ROWS:
-            raise DataValidationError(
-                f"File too large: {len(df)} rows. Maximum allowed: {self.MAX_ROWS}"
+        if len(content) < PARSE_OFFLOAD_MIN_BYTES:
+            df = self._prepare_frame(content)
+        else:
+            # Large uploads parse in a worker process so the event loop keeps
+            # serving other requests (and concurrent uploads use more cores)
+            loop = asyncio.get_running_loop()
+            df, warnings = await loop.run_in_executor(
+                _get_parse_pool(), _parse_and_normalize, content
             )
-        
-        if len(df) == 0:
-            raise DataValidationError("File is empty or has no valid data rows")
-
-        # Normalize column names
-        df.columns = df.columns.str.lower().str.strip()
-
-        # Validate required columns
-        self._validate_columns(df)
-
-        # Normalize data
-        df = self._normalize_dates(df)
-        df = self._normalize_amounts(df)
-        df = self._clean_descriptions(df)
-        
-        # Validate data sanity
-        df = self._validate_data_sanity(df)
+            self.validation_warnings.extend(warnings)
 
         # Create session with user ownership
         session_id = str(uuid.uuid4())
@@ -110,15 +119,12 @@ class CSVProcessor:
         self.db.add(session)
 
         # Create transactions
-        for _, row in df.iterrows():
-            transaction = Transaction(
-                session_id=session_id,
-                date=row["date"],
-                description=row["description"],
-                amount=row["amount"],
-                raw_description=row.get("raw_description", row["description"]),
-            )
-            self.db.add(transaction)
+        rows = (
+            df[["date", "description", "amount", "raw_description"]]
+            .assign(session_id=session_id)
+            .to_dict("records")
+        )
+        self._insert_transactions(rows)
 
         self.db.commit()
         return session_id, len(df)
@@ -126,7 +132,8 @@ class CSVProcessor:
     def process_synthetic(
         self, 
         transactions: list[dict],
-        clerk_user_id: str = None
+        clerk_user_id: str = None,
+        filename: str = "sample_transactions.csv"
     ) -> tuple[str, int]:
         """
         Process synthetic transaction data.
@@ -134,6 +141,7 @@ class CSVProcessor:
         Args:
             transactions: List of transaction dictionaries.
             clerk_user_id: Clerk user ID for session ownership.
+            filename: Filename recorded on the sample session.
             
         Returns:
             Tuple of (session_id, row_count).
@@ -142,7 +150,7 @@ class CSVProcessor:
         session = Session(
             id=session_id,
             clerk_user_id=clerk_user_id or "anonymous",
-            filename="sample_transactions.csv",
+            filename=filename,
             row_count=len(transactions),
             status="processing",
             is_sample=True,
@@ -150,19 +158,90 @@ class CSVProcessor:
         )
         self.db.add(session)
 
-        for txn in transactions:
-            transaction = Transaction(
+        rows = [
+            dict(
                 session_id=session_id,
                 date=txn["date"],
                 description=txn["description"],
                 amount=txn["amount"],
                 raw_description=txn["description"],
             )
-            self.db.add(transaction)
+            for txn in transactions
+        ]
+        self._insert_transactions(rows)
 
         self.db.commit()
         return session_id, len(transactions)
 
+    def _prepare_frame(self, content: bytes) -> pd.DataFrame:
+        """
+        Parse, validate and normalize raw CSV bytes (no database access).
+
+        Args:
+            content: Raw uploaded file bytes.
+
+        Returns:
+            DataFrame with normalized date, description, amount and
+            raw_description columns.
+        """
+        df = self._read_csv(content)
+        
+        # Check row count
+        if len(df) > self.MAX_ROWS:
+            raise DataValidationError(
+                f"File too large: {len(df)} rows. Maximum allowed: {self.MAX_ROWS}"
+            )
+        
+        if len(df) == 0:
+            raise DataValidationError("File is empty or has no valid data rows")
+
+        # Normalize column names
+        df.columns = df.columns.str.lower().str.strip()
+
+        # Validate required columns
+        self._validate_columns(df)
+
+        # Normalize data
+        df = self._normalize_dates(df)
+        df = self._normalize_amounts(df)
+        df = self._clean_descriptions(df)
+        
+        # Validate data sanity
+        return self._validate_data_sanity(df)
+
+    def _insert_transactions(self, rows: List[Dict]) -> None:
+        """
+        Insert transaction rows in one executemany instead of per-row ORM adds.
+
+        The pending Session is flushed first so the session_id foreign key
+        exists before the transactions reference it.
+        """
+        self.db.flush()
+        if rows:
+            self.db.execute(insert(Transaction), rows)
+
+    def _read_csv(self, content: bytes) -> pd.DataFrame:
+        """
+        Parse raw CSV bytes into a DataFrame.
+
+        Uses Arrow's reader on a zero-copy buffer over the bytes when pyarrow
+        is installed. Input it can't take as UTF-8 text (binary columns,
+        ragged rows) falls back to the pandas C engine, which also reads the
+        bytes directly as UTF-8 or latin-1 without a decoded str copy.
+        """
+        if PYARROW_AVAILABLE:
+            try:
+                table = pa_csv.read_csv(pa.py_buffer(content))
+                if not any(pa.types.is_binary(f.type) for f in table.schema):
+                    return table.to_pandas()
+            except pa.ArrowException:
+                pass
+
+        try:
+            return pd.read_csv(BytesIO(content), encoding="utf-8")
+        except UnicodeDecodeError:
+            return pd.read_csv(BytesIO(content), encoding="latin-1")
+
     def _validate_columns(self, df: pd.DataFrame) -> None:
         """Validate that required columns exist."""
         missing = []
@@ -187,66 +266,84 @@ class CSVProcessor:
             raise ValueError(f"Missing required columns: {', '.join(missing)}")
 
     def _normalize_dates(self, df: pd.DataFrame) -> pd.DataFrame:
-        """Convert dates to consistent format."""
-
-        def parse_date(val):
-            if pd.isna(val):
-                return None
-            if isinstance(val, datetime):
-                return val.date()
-            val_str = str(val).strip()
-            for fmt in self.DATE_FORMATS:
-                try:
-                    return datetime.strptime(val_str, fmt).date()
-                except ValueError:
-                    continue
-            # Try pandas parser as fallback
-            try:
-                return pd.to_datetime(val_str).date()
-            except Exception:
-                raise ValueError(f"Cannot parse date: {val_str}")
+        """
+        Convert dates to consistent format.
+
+        Each DATE_FORMATS entry is tried in order as one vectorized pass over
+        the still-unparsed rows, then one format="mixed" pass takes whatever
+        is left. Values that fail every pass are reported in a single
+        ValueError.
+        """
+        dates = df["date"]
+        if pd.api.types.is_datetime64_any_dtype(dates):
+            df["date"] = dates.dt.date
+            return df.dropna(subset=["date"])
+
+        # Blank cells count as missing and are dropped with the NaN rows
+        text = dates.astype("string").str.strip().replace("", pd.NA)
+        parsed = pd.Series(pd.NaT, index=df.index, dtype="datetime64[ns]")
+        for fmt in self.DATE_FORMATS:
+            remaining = parsed.isna() & text.notna()
+            if not remaining.any():
+                break
+            parsed[remaining] = pd.to_datetime(text[remaining], format=fmt, errors="coerce")
+
+        result = parsed.dt.date.astype(object)
+        leftover = parsed.isna() & text.notna()
+        if leftover.any():
+            mixed = pd.to_datetime(text[leftover], format="mixed", errors="coerce")
+            result[leftover] = mixed.dt.date.astype(object)
+
+            unparsed = text[leftover][mixed.isna()]
+            if not unparsed.empty:
+                # Dates outside pandas' Timestamp range (e.g. year 999)
+                # still parse here and are dropped later as too old
+                strict = unparsed.map(self._parse_date_strict)
+                bad = unparsed[strict.isna()]
+                if not bad.empty:
+                    raise ValueError(
+                        f"Cannot parse date: {', '.join(bad.unique()[:5])}"
+                    )
+                result[strict.index] = strict
 
-        df["date"] = df["date"].apply(parse_date)
+        df["date"] = result
         df = df.dropna(subset=["date"])
         return df
 
+    def _parse_date_strict(self, val: str) -> Optional[date]:
+        """Parse a date string with DATE_FORMATS only (None if none match)."""
+        for fmt in self.DATE_FORMATS:
+            try:
+                return datetime.strptime(val, fmt).date()
+            except ValueError:
+                continue
+        return None
+
     def _normalize_amounts(self, df: pd.DataFrame) -> pd.DataFrame:
-        """Normalize amount values."""
-
-        def parse_amount(val):
-            if pd.isna(val):
-                return 0.0
-            if isinstance(val, (int, float)):
-                return float(val)
-            val_str = str(val).strip()
+        """Normalize amount values (unparseable or missing amounts become 0)."""
+        amounts = df["amount"]
+        if not pd.api.types.is_numeric_dtype(amounts):
+            text = amounts.astype("string").str.strip()
             # Remove currency symbols and commas
-            val_str = re.sub(r"[$,]", "", val_str)
+            text = text.str.replace(_AMOUNT_STRIP_RE, "", regex=True)
             # Handle parentheses as negative
-            if val_str.startswith("(") and val_str.endswith(")"):
-                val_str = "-" + val_str[1:-1]
-            try:
-                return float(val_str)
-            except ValueError:
-                return 0.0
+            negative = text.str.startswith("(") & text.str.endswith(")")
+            text = text.mask(negative, "-" + text.str.slice(1, -1))
+            amounts = pd.to_numeric(text, errors="coerce")
 
-        df["amount"] = df["amount"].apply(parse_amount)
+        df["amount"] = amounts.fillna(0.0).astype(float)
         return df
 
     def _clean_descriptions(self, df: pd.DataFrame) -> pd.DataFrame:
         """Clean and normalize descriptions."""
-
-        def clean_desc(val):
-            if pd.isna(val):
-                return "Unknown"
-            desc = str(val).strip()
-            # Remove extra whitespace
-            desc = re.sub(r"\s+", " ", desc)
-            # Remove common prefixes
-            desc = re.sub(r"^(POS |CHECKCARD |DEBIT |CREDIT )", "", desc, flags=re.I)
-            return desc if desc else "Unknown"
+        desc = df["description"].astype("string").str.strip()
+        # Remove extra whitespace
+        desc = desc.str.replace(_WHITESPACE_RE, " ", regex=True)
+        # Remove common prefixes (after collapsing, so "POS   X" matches too)
+        desc = desc.str.replace(_DESCRIPTION_PREFIX_RE, "", regex=True)
 
         df["raw_description"] = df["description"]
-        df["description"] = df["description"].apply(clean_desc)
+        df["description"] = desc.mask(desc.isna() | desc.eq(""), "Unknown").astype(object)
         return df
     
     def _validate_data_sanity(self, df: pd.DataFrame) -> pd.DataFrame:
@@ -321,17 +418,18 @@ class CSVProcessor:
         
         # Check 6: Income marked as negative (common data error)
         income_keywords = ['paycheck', 'salary', 'deposit', 'refund', 'dividend']
-        for idx, row in df.iterrows():
-            if idx in rows_to_remove:
-                continue
-            desc_lower = str(row.get('description', '')).lower()
-            if any(keyword in desc_lower for keyword in income_keywords):
-                if row['amount'] < 0:
-                    # Fix: income should be positive
-                    df.at[idx, 'amount'] = abs(row['amount'])
-                    self.validation_warnings.append(
-                        f"Fixed negative income: {row['description'][:30]}"
-                    )
+        negative_income = (
+            ~df.index.isin(rows_to_remove)
+            & df['description'].astype(str).str.lower().str.contains('|'.join(income_keywords))
+            & (df['amount'] < 0)
+        )
+        if negative_income.any():
+            # Fix: income should be positive
+            df.loc[negative_income, 'amount'] = df.loc[negative_income, 'amount'].abs()
+            self.validation_warnings.extend(
+                f"Fixed negative income: {desc[:30]}"
+                for desc in df.loc[negative_income, 'description']
+            )
         
         # Remove flagged rows
         if rows_to_remove:
@@ -350,4 +448,36 @@ class CSVProcessor:
             for warning in self.validation_warnings:
                 print(f"   - {warning}")
         
-        return df.reset_index(drop=True)
\ No newline at end of file
+        return df.reset_index(drop=True)
+
+
+def _get_parse_pool() -> ProcessPoolExecutor:
+    """Shared parse pool, started on the first large upload."""
+    global _parse_pool
+    if _parse_pool is None:
+        # spawn: forking a threaded server process is unsafe
+        _parse_pool = ProcessPoolExecutor(
+            max_workers=PARSE_WORKERS,
+            mp_context=multiprocessing.get_context("spawn"),
+        )
+    return _parse_pool
+
+
+def shutdown_parse_pool() -> None:
+    """Stop the parse workers (called on application shutdown)."""
+    global _parse_pool
+    if _parse_pool is not None:
+        _parse_pool.shutdown(wait=True, cancel_futures=True)
+        _parse_pool = None
+
+
+def _parse_and_normalize(content: bytes) -> tuple[pd.DataFrame, List[str]]:
+    """
+    Worker-process entry point for CSVProcessor._prepare_frame.
+
+    Returns:
+        Tuple of (normalized DataFrame, validation warnings).
+    """
+    processor = CSVProcessor(db=None)
+    df = processor._prepare_frame(content)
+    return df, processor.validation_warnings
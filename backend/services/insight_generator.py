@@ -25,9 +25,8 @@ class InsightGenerator:
         ai_insights = await self.ai_service.generate_insights(context)
 
         # Store insights
-        insights_created = 0
-        for insight_data in ai_insights:
-            insight = Insight(
+        insights = [
+            Insight(
                 session_id=session_id,
                 type=insight_data.get("type", "spending"),
                 priority=insight_data.get("priority", 2),
@@ -38,11 +37,13 @@ class InsightGenerator:
                 confidence=insight_data.get("confidence", 0.8),
                 data=insight_data.get("data"),
             )
-            self.db.add(insight)
-            insights_created += 1
+            for insight_data in ai_insights
+        ]
+        # One batched INSERT; created_at defaults still apply
+        self.db.bulk_save_objects(insights, return_defaults=False)
 
         self.db.commit()
-        return insights_created
+        return len(insights)
 
     def _build_context(self, session_id: str) -> dict:
         """Build privacy-safe context for AI - aggregated data only."""
@@ -178,7 +179,7 @@ class InsightGenerator:
         if len(months) < 2:
             return 0
 
-        deltas_created = 0
+        deltas = []
         current_month = months[-1]
         previous_month = months[-2]
 
@@ -195,7 +196,7 @@ class InsightGenerator:
             else:
                 change_percent = 100 if current != 0 else 0
 
-            delta = Delta(
+            deltas.append(Delta(
                 session_id=session_id,
                 category_id=category_id,
                 current_month=str(current_month),
@@ -204,9 +205,8 @@ class InsightGenerator:
                 previous_amount=previous,
                 change_amount=current - previous,
                 change_percent=change_percent,
-            )
-            self.db.add(delta)
-            deltas_created += 1
+            ))
 
+        self.db.bulk_save_objects(deltas, return_defaults=False)
         self.db.commit()
-        return deltas_created
+        return len(deltas)
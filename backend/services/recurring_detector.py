@@ -16,13 +16,69 @@ Author: Smart Financial Coach Team
 """
 
 import re
-from collections import defaultdict
 from datetime import date
-from typing import Optional
+from typing import Optional, Tuple
+import numpy as np
+import pandas as pd
+from sqlalchemy import insert, select
 from sqlalchemy.orm import Session as DBSession
 
 from models import Transaction, RecurringCharge, Category
 
+# Description noise stripped before grouping, in one pass: long numbers
+# (transaction IDs), order numbers and asterisks. "#" only takes a digit run
+# of up to 3, since a longer run is removed as a long number and leaves the
+# "#" behind.
+_NOISE_RE = re.compile(r"\d{4,}|#\d{1,3}(?!\d)|\*+")
+_WHITESPACE_RE = re.compile(r"\s+")
+
+
+def _group_stats(codes: np.ndarray, days: np.ndarray,
+                 amounts: np.ndarray) -> dict[str, np.ndarray]:
+    """
+    Interval and amount statistics for every group in a few array passes.
+
+    Args:
+        codes: Group code (0..k-1) per row, rows in date order.
+        days: int64 date.toordinal() per row.
+        amounts: Amount per row.
+
+    Returns:
+        Length-k arrays: count, avg_interval, interval_variance (population),
+        avg_amount, first_row, first_day and last_day. Interval stats are
+        NaN for single-row groups.
+    """
+    k = int(codes.max()) + 1
+    order = np.argsort(codes, kind="stable")
+    sorted_codes = codes[order]
+    sorted_days = days[order]
+
+    count = np.bincount(codes, minlength=k)
+    starts = np.cumsum(count) - count
+
+    # Day gaps between consecutive rows of the same group
+    same_group = sorted_codes[1:] == sorted_codes[:-1]
+    gap_codes = sorted_codes[1:][same_group]
+    gaps = np.diff(sorted_days)[same_group]
+    n_gaps = count - 1
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        avg_interval = np.bincount(gap_codes, weights=gaps, minlength=k) / n_gaps
+        deviations = gaps - avg_interval[gap_codes]
+        interval_variance = np.bincount(
+            gap_codes, weights=deviations * deviations, minlength=k
+        ) / n_gaps
+
+    return {
+        "count": count,
+        "avg_interval": avg_interval,
+        "interval_variance": interval_variance,
+        "avg_amount": np.bincount(codes, weights=amounts, minlength=k) / count,
+        "first_row": order[starts],
+        "first_day": sorted_days[starts],
+        "last_day": sorted_days[starts + count - 1],
+    }
+
 
 class RecurringDetector:
     """
@@ -75,95 +131,116 @@ class RecurringDetector:
         r'insurance', r'paycheck', r'salary',
     ]
 
+    # Each pattern list as one compiled alternation
+    _SUBSCRIPTION_RE = re.compile(
+        '|'.join(f'(?:{p})' for p in SUBSCRIPTION_PATTERNS), re.IGNORECASE
+    )
+    _NON_SUBSCRIPTION_RE = re.compile(
+        '|'.join(f'(?:{p})' for p in NON_SUBSCRIPTION_PATTERNS), re.IGNORECASE
+    )
+
     def __init__(self, db: DBSession):
         self.db = db
 
     def detect(self, session_id: str) -> int:
         """Detect recurring charges in transactions."""
-        transactions = (
-            self.db.query(Transaction)
-            .filter(Transaction.session_id == session_id)
-            .filter(Transaction.amount < 0)  # Spending only
+        # Category name joined in: one round-trip instead of a Category scan
+        transactions = self.db.execute(
+            select(Transaction.date, Transaction.amount,
+                   Transaction.description, Transaction.category_id,
+                   Category.name.label("category_name"))
+            .outerjoin(Category, Transaction.category_id == Category.id)
+            .where(Transaction.session_id == session_id,
+                   Transaction.amount < 0)  # Spending only
             .order_by(Transaction.date)
-            .all()
-        )
+        ).all()
 
         if len(transactions) < 2:
             return 0
 
+        # One pass into column arrays; dates as int64 day ordinals
+        n = len(transactions)
+        days = np.empty(n, dtype=np.int64)
+        amounts = np.empty(n, dtype=np.float64)
+        descriptions: list = [None] * n
+        category_ids: list = [None] * n
+        category_names: list = [None] * n
+        for i, t in enumerate(transactions):
+            days[i] = t.date.toordinal()
+            amounts[i] = t.amount
+            descriptions[i] = t.description
+            category_ids[i] = t.category_id
+            category_names[i] = t.category_name
+
         # Group by normalized description
-        grouped = self._group_similar_transactions(transactions)
-
-        recurring_count = 0
-        category_map = {c.id: c for c in self.db.query(Category).all()}
-
-        for pattern, txns in grouped.items():
-            if len(txns) < 2:
-                continue
-
-            # Check for regular intervals
-            intervals = self._calculate_intervals(txns)
-            if not intervals:
-                continue
-
-            avg_interval = sum(intervals) / len(intervals)
-            interval_variance = self._variance(intervals)
-
-            # Monthly (28-31 days) or weekly (6-8 days) patterns
-            is_monthly = 25 <= avg_interval <= 35 and interval_variance < 25
-            is_weekly = 6 <= avg_interval <= 8 and interval_variance < 4
-
-            if is_monthly or is_weekly:
-                avg_amount = sum(t.amount for t in txns) / len(txns)
-                category_id = txns[0].category_id
-
-                # Determine frequency string
-                if is_weekly:
-                    frequency_days = 7
-                else:
-                    frequency_days = 30
-
-                # Gray charge detection: small, possibly unknown, recurring
-                category_name = (
-                    category_map[category_id].name if category_id else "Other"
-                )
-                is_gray = abs(avg_amount) < 15 and category_name in [
-                    "Other",
-                    "Subscriptions",
-                ]
-
-                # Check for obviously small forgotten charges
-                if abs(avg_amount) < 5 and len(pattern) < 20:
-                    is_gray = True
-
-                # Calculate confidence based on regularity
-                confidence = 1.0 - min(interval_variance / 20, 0.5)
-
-                # Determine if this is a known subscription type
-                is_subscription = self._is_known_subscription(pattern)
-                is_utility = self._is_utility_or_bill(pattern)
-                
-                # Boost confidence for known subscription patterns
-                if is_subscription:
-                    confidence = min(confidence + 0.1, 1.0)
-                
-                recurring = RecurringCharge(
-                    session_id=session_id,
-                    description_pattern=pattern,
-                    category_id=category_id,
-                    average_amount=avg_amount,
-                    frequency_days=frequency_days,
-                    occurrence_count=len(txns),
-                    first_seen=min(t.date for t in txns),
-                    last_seen=max(t.date for t in txns),
-                    is_gray_charge=is_gray,
-                    confidence=confidence,
-                )
-                self.db.add(recurring)
-                recurring_count += 1
+        patterns, codes = self._group_similar_transactions(descriptions)
+        stats = _group_stats(codes, days, amounts)
+        avg_interval = stats["avg_interval"]
+        interval_variance = stats["interval_variance"]
+
+        # Monthly (28-31 days) or weekly (6-8 days) patterns; single-row
+        # groups have NaN stats and fail every comparison
+        is_monthly = (avg_interval >= 25) & (avg_interval <= 35) & (interval_variance < 25)
+        is_weekly = (avg_interval >= 6) & (avg_interval <= 8) & (interval_variance < 4)
+        kept = np.flatnonzero(is_monthly | is_weekly)
+
+        if kept.size == 0:
+            self.db.commit()
+            return 0
 
+        kept_patterns = patterns[kept]
+        first_rows = stats["first_row"][kept].tolist()
+        group_category_ids = [category_ids[r] for r in first_rows]
+        avg_amount = stats["avg_amount"][kept]
+        abs_amount = np.abs(avg_amount)
+
+        # Determine frequency
+        frequency_days = np.where(is_weekly[kept], 7, 30)
+
+        # Gray charge detection: small, possibly unknown, recurring
+        in_gray_category = np.array([
+            (category_names[r] if category_id else "Other") in ("Other", "Subscriptions")
+            for r, category_id in zip(first_rows, group_category_ids)
+        ], dtype=bool)
+        is_gray = (abs_amount < 15) & in_gray_category
+        # Check for obviously small forgotten charges
+        is_gray |= (abs_amount < 5) & (kept_patterns.str.len().to_numpy() < 20)
+
+        # Calculate confidence based on regularity, boosted for known
+        # subscription patterns
+        confidence = 1.0 - np.minimum(interval_variance[kept] / 20, 0.5)
+        is_subscription = np.fromiter(
+            (self._is_known_subscription(p) for p in kept_patterns),
+            dtype=bool, count=kept.size,
+        )
+        confidence = np.where(is_subscription, np.minimum(confidence + 0.1, 1.0), confidence)
+
+        rows = [
+            dict(
+                session_id=session_id,
+                description_pattern=pattern,
+                category_id=category_id,
+                average_amount=amount,
+                frequency_days=frequency,
+                occurrence_count=count,
+                first_seen=date.fromordinal(first_day),
+                last_seen=date.fromordinal(last_day),
+                is_gray_charge=gray,
+                confidence=conf,
+            )
+            for pattern, category_id, amount, frequency, count, first_day, last_day, gray, conf
+            in zip(
+                kept_patterns, group_category_ids, avg_amount.tolist(),
+                frequency_days.tolist(), stats["count"][kept].tolist(),
+                stats["first_day"][kept].tolist(), stats["last_day"][kept].tolist(),
+                is_gray.tolist(), confidence.tolist(),
+            )
+        ]
+
+        # One executemany instead of per-row ORM adds
+        self.db.execute(insert(RecurringCharge), rows)
         self.db.commit()
-        return recurring_count
+        return len(rows)
     
     def _is_known_subscription(self, description: str) -> bool:
         """
@@ -185,11 +262,7 @@ class RecurringDetector:
                 return True
         
         # Check regex patterns
-        for pattern in self.SUBSCRIPTION_PATTERNS:
-            if re.search(pattern, desc_lower, re.IGNORECASE):
-                return True
-        
-        return False
+        return self._SUBSCRIPTION_RE.search(desc_lower) is not None
     
     def _is_utility_or_bill(self, description: str) -> bool:
         """
@@ -203,56 +276,27 @@ class RecurringDetector:
         Returns:
             True if matches utility/bill pattern.
         """
-        desc_lower = description.lower()
-        
-        for pattern in self.NON_SUBSCRIPTION_PATTERNS:
-            if re.search(pattern, desc_lower, re.IGNORECASE):
-                return True
-        
-        return False
+        return self._NON_SUBSCRIPTION_RE.search(description.lower()) is not None
 
     def _group_similar_transactions(
-        self, transactions: list[Transaction]
-    ) -> dict[str, list[Transaction]]:
-        """Group transactions by similar description patterns."""
-        groups = defaultdict(list)
-
-        for txn in transactions:
-            # Normalize description for grouping
-            pattern = self._normalize_for_matching(txn.description)
-            groups[pattern].append(txn)
-
-        return groups
-
-    def _normalize_for_matching(self, description: str) -> str:
-        """Normalize description for pattern matching."""
-        # Convert to uppercase
-        s = description.upper()
-
-        # Remove common transaction noise
-        s = re.sub(r"\d{4,}", "", s)  # Remove long numbers (transaction IDs)
-        s = re.sub(r"#\d+", "", s)  # Remove order numbers
-        s = re.sub(r"\*+", "", s)  # Remove asterisks
-        s = re.sub(r"\s+", " ", s)  # Normalize whitespace
-        s = s.strip()
-
-        # Take first 30 chars for matching
-        return s[:30] if len(s) > 30 else s
-
-    def _calculate_intervals(self, transactions: list[Transaction]) -> list[int]:
-        """Calculate day intervals between transactions."""
-        dates = sorted([t.date for t in transactions])
-        intervals = []
-
-        for i in range(1, len(dates)):
-            interval = (dates[i] - dates[i - 1]).days
-            intervals.append(interval)
-
-        return intervals
-
-    def _variance(self, values: list[float]) -> float:
-        """Calculate variance of a list of numbers."""
-        if len(values) < 2:
-            return 0
-        mean = sum(values) / len(values)
-        return sum((x - mean) ** 2 for x in values) / len(values)
+        self, descriptions: list[str]
+    ) -> Tuple[pd.Index, np.ndarray]:
+        """
+        Group rows by similar description patterns.
+
+        Returns:
+            Tuple of (patterns in order of first appearance, group code per row).
+        """
+        patterns = self._normalize_descriptions(pd.Series(descriptions, dtype=object))
+        codes, uniques = pd.factorize(patterns)
+        return uniques, codes
+
+    def _normalize_descriptions(self, descriptions: pd.Series) -> pd.Series:
+        """Normalize a column of descriptions for pattern matching."""
+        return (
+            descriptions.str.upper()
+            .str.replace(_NOISE_RE, "", regex=True)  # Remove transaction noise
+            .str.replace(_WHITESPACE_RE, " ", regex=True)  # Normalize whitespace
+            .str.strip()
+            .str.slice(0, 30)  # Take first 30 chars for matching
+        )
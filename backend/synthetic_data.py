@@ -29,9 +29,28 @@ Usage:
 import random
 import csv
 from datetime import datetime, timedelta, date
+from functools import lru_cache
 from typing import List, Dict, Tuple
 from collections import defaultdict
 
+import numpy as np
+
+
+@lru_cache(maxsize=None)
+def _temporal_day_weights(days_in_month: int) -> np.ndarray:
+    """
+    Cumulative day weights for temporal sampling (day 0 = 1st of month).
+
+    - 60% more weight on payday weeks (days 1-3, 15-17)
+    - 40% more weight on (approximate) weekends
+    """
+    day = np.arange(days_in_month)
+    day_of_month = day + 1
+    weights = np.ones(days_in_month)
+    weights[(day_of_month <= 3) | ((day_of_month >= 15) & (day_of_month <= 17))] *= 1.6
+    weights[day % 7 >= 5] *= 1.4  # Simplified weekend check
+    return np.cumsum(weights)
+
 
 class SyntheticDataGenerator:
     """
@@ -49,6 +68,8 @@ class SyntheticDataGenerator:
             seed: Random seed for reproducibility.
         """
         random.seed(seed)
+        # Batch draws for the bulk random transactions
+        self.rng = np.random.default_rng(seed)
         # Dynamic date range: 6 months ending yesterday
         today = datetime.now()
         self.end_date = today - timedelta(days=1)
@@ -131,9 +152,13 @@ class SyntheticDataGenerator:
         anomalies = self._generate_distributed_anomalies()
         transactions.extend(anomalies)
         
-        # Sort by date
-        transactions.sort(key=lambda x: x['date'])
-        return transactions
+        # Sort by date: one stable argsort on int64 day ordinals
+        ordinals = np.fromiter(
+            (t['date'].toordinal() for t in transactions),
+            dtype=np.int64, count=len(transactions),
+        )
+        order = np.argsort(ordinals, kind='stable')
+        return [transactions[i] for i in order.tolist()]
     
     def _get_recurring_patterns(self) -> List[Dict]:
         """
@@ -382,35 +407,46 @@ class SyntheticDataGenerator:
             'Entertainment': (15, 60),
         }
         
-        transactions = []
+        names = list(categories)
+        merchants = [m for name in names for m in categories[name]]
+        merchant_counts = np.array([len(categories[name]) for name in names])
+        merchant_offsets = np.cumsum(merchant_counts) - merchant_counts
+        min_amts = np.array([amount_ranges[name][0] for name in names], dtype=float)
+        max_amts = np.array([amount_ranges[name][1] for name in names], dtype=float)
         days_in_month = (month_end - month_start).days
-        
-        for _ in range(count):
-            category = random.choice(list(categories.keys()))
-            merchant = random.choice(categories[category])
-            min_amt, max_amt = amount_ranges[category]
-            amount = round(random.uniform(min_amt, max_amt), 2)
-            
-            # Apply temporal weighting for day selection
-            day_offset = self._get_temporal_day(days_in_month)
-            txn_date = month_start + timedelta(days=day_offset)
-            
-            # Weekend spending boost (40% higher amounts)
-            if txn_date.weekday() >= 5:
-                amount *= 1.4
-            
-            # Payday spending boost (slightly higher on payday weeks)
-            day_of_month = day_offset + 1
-            if day_of_month <= 3 or 15 <= day_of_month <= 17:
-                amount *= 1.2
-            
-            transactions.append({
-                'date': txn_date.date(),
-                'description': merchant,
+
+        # Draw every transaction's category, merchant, amount and day at once
+        cats = self.rng.integers(0, len(names), size=count)
+        merchant_idx = merchant_offsets[cats] + (
+            self.rng.random(count) * merchant_counts[cats]
+        ).astype(np.int64)
+        amounts = np.round(self.rng.uniform(min_amts[cats], max_amts[cats]), 2)
+
+        # Apply temporal weighting for day selection
+        cumulative = _temporal_day_weights(days_in_month)
+        day_offsets = np.searchsorted(
+            cumulative, self.rng.uniform(0, cumulative[-1], size=count)
+        ).clip(max=days_in_month - 1)
+
+        # Weekend spending boost (40% higher amounts)
+        weekdays = (month_start.weekday() + day_offsets) % 7
+        amounts = np.where(weekdays >= 5, amounts * 1.4, amounts)
+
+        # Payday spending boost (slightly higher on payday weeks)
+        day_of_month = day_offsets + 1
+        is_payday = (day_of_month <= 3) | ((day_of_month >= 15) & (day_of_month <= 17))
+        amounts = np.where(is_payday, amounts * 1.2, amounts)
+
+        return [
+            {
+                'date': (month_start + timedelta(days=offset)).date(),
+                'description': merchants[m],
                 'amount': round(-amount, 2)
-            })
-        
-        return transactions
+            }
+            for offset, m, amount in zip(
+                day_offsets.tolist(), merchant_idx.tolist(), amounts.tolist()
+            )
+        ]
     
     def _get_temporal_day(self, days_in_month: int) -> int:
         """
@@ -420,34 +456,10 @@ class SyntheticDataGenerator:
         - 60% more transactions on payday weeks (days 1-3, 15-17)
         - 40% higher probability on weekends
         """
-        # Create weighted day distribution
-        weights = []
-        for day in range(days_in_month):
-            day_of_month = day + 1
-            
-            # Base weight
-            weight = 1.0
-            
-            # Payday boost (days 1-3 and 15-17)
-            if day_of_month <= 3 or 15 <= day_of_month <= 17:
-                weight *= 1.6
-            
-            # Weekend boost (calculate what day of week this would be)
-            # This is approximate since we don't know the actual month start
-            if day % 7 >= 5:  # Simplified weekend check
-                weight *= 1.4
-            
-            weights.append(weight)
-        
         # Weighted random selection
-        total = sum(weights)
-        r = random.uniform(0, total)
-        cumulative = 0
-        for day, weight in enumerate(weights):
-            cumulative += weight
-            if r <= cumulative:
-                return day
-        return days_in_month - 1
+        cumulative = _temporal_day_weights(days_in_month)
+        r = random.uniform(0, cumulative[-1])
+        return min(int(np.searchsorted(cumulative, r)), days_in_month - 1)
     
     def _generate_distributed_anomalies(self) -> List[Dict]:
         """
@@ -572,13 +584,14 @@ class SyntheticDataGenerator:
         with open(filename, 'w', newline='') as f:
             writer = csv.DictWriter(f, fieldnames=['date', 'description', 'amount'])
             writer.writeheader()
-            for txn in transactions:
-                row = {
+            writer.writerows(
+                {
                     'date': txn['date'].isoformat() if hasattr(txn['date'], 'isoformat') else txn['date'],
                     'description': txn['description'],
                     'amount': txn['amount']
                 }
-                writer.writerow(row)
+                for txn in transactions
+            )
         print(f"✅ Generated {len(transactions)} transactions → {filename}")
         return filename
     
@@ -0,0 +1,478 @@
+"""
+Test Module: test_ai_service.py
+Description: Unit tests for the OpenAI wrapper (no network access).
+
+Tests:
+    - Result cache and single-flight coalescing
+    - Insight generation, caching and fallback
+    - Circuit breaker and retry/backoff handling
+    - Trivial-context skip and prompt context shrinking
+    - JSON encoding of numpy values
+    - Shared HTTP client configuration
+
+Author: Smart Financial Coach Team
+"""
+
+import asyncio
+import json
+from types import SimpleNamespace
+
+import httpx
+import numpy as np
+import pytest
+
+import sys
+from pathlib import Path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+import services.ai_service as ai_module
+from services.ai_service import AIService, CircuitOpenError, _CircuitBreaker
+
+
+# =============================================================================
+# Fixtures
+# =============================================================================
+
+@pytest.fixture
+def ai_service(monkeypatch):
+    """AIService in fallback mode with its own (not process-wide) cache."""
+    monkeypatch.delenv("OPENAI_API_KEY", raising=False)
+    service = AIService()
+    service._ai_cache = {}
+    service._inflight = {}
+    service._breaker = _CircuitBreaker()
+    return service
+
+
+# =============================================================================
+# Result Cache Tests
+# =============================================================================
+
+class TestSingleFlight:
+    """Tests for coalescing of concurrent identical calls."""
+
+    @pytest.mark.asyncio
+    async def test_owner_cancel_does_not_cancel_waiters(self, ai_service):
+        """A cancelled first caller must not abort requests coalesced onto it."""
+        release = asyncio.Event()
+        calls = 0
+
+        async def compute():
+            nonlocal calls
+            calls += 1
+            await release.wait()
+            return [{"title": "insight"}]
+
+        owner = asyncio.create_task(ai_service._cached("insights", {"x": 1}, compute))
+        await asyncio.sleep(0)
+        waiter = asyncio.create_task(ai_service._cached("insights", {"x": 1}, compute))
+        await asyncio.sleep(0)
+
+        owner.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await owner
+
+        release.set()
+        assert await waiter == [{"title": "insight"}]
+        assert calls == 1
+        assert ai_service._inflight == {}
+
+        key = ai_service._cache_key("insights", {"x": 1})
+        assert ai_service._cache_get("insights", key) == [{"title": "insight"}]
+
+    @pytest.mark.asyncio
+    async def test_exception_reaches_every_waiter_and_is_not_cached(self, ai_service):
+        """Failures propagate to all coalesced callers and are retried next time."""
+        release = asyncio.Event()
+
+        async def compute():
+            await release.wait()
+            raise RuntimeError("upstream down")
+
+        callers = [
+            asyncio.create_task(ai_service._cached("insights", {"x": 2}, compute))
+            for _ in range(2)
+        ]
+        await asyncio.sleep(0)
+        release.set()
+
+        results = await asyncio.gather(*callers, return_exceptions=True)
+        assert all(isinstance(r, RuntimeError) for r in results)
+        assert ai_service._inflight == {}
+        assert ai_service._ai_cache == {}
+
+
+class TestResultCache:
+    """Tests for the content-hash result cache."""
+
+    @pytest.mark.asyncio
+    async def test_callers_get_independent_copies(self, ai_service):
+        """Mutating a returned result must not change what later calls see."""
+        async def compute():
+            return [{"title": "insight", "data": {"amount": 10}}]
+
+        first = await ai_service._cached("insights", {"x": 3}, compute)
+        first[0]["data"]["amount"] = 999
+        first.append({"title": "added by caller"})
+
+        second = await ai_service._cached("insights", {"x": 3}, compute)
+        assert second == [{"title": "insight", "data": {"amount": 10}}]
+        second.clear()
+
+        third = await ai_service._cached("insights", {"x": 3}, compute)
+        assert third == [{"title": "insight", "data": {"amount": 10}}]
+
+
+# =============================================================================
+# Insight Generation Tests
+# =============================================================================
+
+INSIGHTS = [
+    {"type": "spending", "title": "Dining is up", "data": {"amount": 12.5}},
+    {"type": "savings", "title": "Cancel a subscription", "data": {"tags": ["a", "b"]}},
+]
+
+INSIGHTS_CONTEXT = {
+    "spending_summary": {
+        "total_spending": -900.0,
+        "by_category": {
+            "Dining": {"amount": -500.0, "count": 10},
+            "Groceries": {"amount": -300.0, "count": 8},
+            "Transport": {"amount": -100.0, "count": 4},
+        },
+    },
+}
+
+
+class FakeCompletionClient:
+    """
+    Stand-in for AsyncOpenAI that replays `replies` in order.
+
+    A reply is either the message content to return or an exception to
+    raise; the last reply repeats once the list is used up.
+    """
+
+    def __init__(self, *replies):
+        self.replies = list(replies)
+        self.calls = 0
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    async def create(self, **kwargs):
+        reply = self.replies[min(self.calls, len(self.replies) - 1)]
+        self.calls += 1
+        if isinstance(reply, BaseException):
+            raise reply
+        message = SimpleNamespace(content=reply, tool_calls=None)
+        return SimpleNamespace(choices=[SimpleNamespace(message=message)], usage=None)
+
+
+class TestGenerateInsights:
+    """Tests for generate_insights over the (non-streamed) completion."""
+
+    @pytest.mark.asyncio
+    async def test_result_is_returned_and_cached(self, ai_service):
+        with_nulls = [{**insight, "action": None} for insight in INSIGHTS]
+        ai_service.client = FakeCompletionClient(json.dumps({"insights": with_nulls}))
+
+        first = await ai_service.generate_insights(INSIGHTS_CONTEXT)
+        second = await ai_service.generate_insights(INSIGHTS_CONTEXT)
+
+        assert first == second == INSIGHTS
+        assert ai_service.client.calls == 1
+
+    @pytest.mark.asyncio
+    async def test_malformed_reply_falls_back_and_is_not_cached(self, ai_service):
+        """Output cut off mid-JSON (e.g. at max_tokens) uses the rule-based insights."""
+        ai_service.client = FakeCompletionClient(json.dumps({"insights": INSIGHTS})[:-5])
+
+        result = await ai_service.generate_insights(INSIGHTS_CONTEXT)
+
+        assert result == ai_service._fallback_insights(INSIGHTS_CONTEXT)
+        assert ai_service._ai_cache == {}
+
+
+# =============================================================================
+# Circuit Breaker Tests
+# =============================================================================
+
+def _expire_cooldown(breaker: _CircuitBreaker) -> None:
+    """Move the open timestamp back so the cooldown has elapsed."""
+    breaker.opened_at -= breaker.cooldown
+
+
+class TestCircuitBreaker:
+    """Tests for the shared OpenAI circuit breaker."""
+
+    def test_opens_after_consecutive_failures(self):
+        breaker = _CircuitBreaker(failure_threshold=3, base_cooldown=10)
+        breaker.record_failure()
+        breaker.record_failure()
+        assert breaker.allow()
+
+        breaker.record_failure()
+
+        assert breaker.state == "open"
+        assert not breaker.allow()
+
+    def test_half_open_lets_one_probe_through(self):
+        breaker = _CircuitBreaker(failure_threshold=1, base_cooldown=10)
+        breaker.record_failure()
+        _expire_cooldown(breaker)
+
+        assert breaker.allow()
+        assert breaker.state == "half_open"
+        assert not breaker.allow()
+
+        breaker.record_success()
+
+        assert breaker.state == "closed"
+        assert breaker.allow() and breaker.allow()
+
+    def test_failed_probe_reopens_with_double_cooldown(self):
+        breaker = _CircuitBreaker(failure_threshold=1, base_cooldown=10, max_cooldown=30)
+        breaker.record_failure()
+        assert breaker.cooldown == 10
+        _expire_cooldown(breaker)
+        assert breaker.allow()
+
+        breaker.record_failure()
+
+        assert breaker.state == "open"
+        assert breaker.cooldown == 20
+        assert not breaker.allow()
+
+        _expire_cooldown(breaker)
+        assert breaker.allow()
+        breaker.record_failure()
+        assert breaker.cooldown == 30
+
+    @pytest.mark.asyncio
+    async def test_open_circuit_fails_fast_without_calling_openai(self, ai_service):
+        ai_service.client = FakeCompletionClient("{}")
+        ai_service._breaker._open()
+
+        with pytest.raises(CircuitOpenError):
+            await ai_service._call_with_retry(messages=[])
+
+        assert ai_service.client.calls == 0
+
+    @pytest.mark.asyncio
+    async def test_open_circuit_uses_fallback_insights(self, ai_service):
+        ai_service.client = FakeCompletionClient(json.dumps({"insights": INSIGHTS}))
+        ai_service._breaker._open()
+
+        result = await ai_service.generate_insights(INSIGHTS_CONTEXT)
+
+        assert result == ai_service._fallback_insights(INSIGHTS_CONTEXT)
+        assert ai_service.client.calls == 0
+
+
+# =============================================================================
+# Retry Tests
+# =============================================================================
+
+def _openai_error(name: str, status: int = 0, headers: dict = None) -> Exception:
+    """An openai exception built the way the SDK raises it."""
+    openai = pytest.importorskip("openai")
+    request = httpx.Request("POST", "https://api.openai.com/v1/chat/completions")
+    error_cls = getattr(openai, name)
+    if not status:
+        return error_cls(request=request)
+    response = httpx.Response(status, headers=headers, request=request)
+    return error_cls("error", response=response, body=None)
+
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    """Record retry delays instead of sleeping."""
+    delays = []
+
+    async def fake_sleep(delay):
+        delays.append(delay)
+
+    monkeypatch.setattr(ai_module.asyncio, "sleep", fake_sleep)
+    return delays
+
+
+class TestRetry:
+    """Tests for _call_with_retry backoff and error classification."""
+
+    @pytest.mark.asyncio
+    async def test_transient_errors_are_retried_with_backoff(self, ai_service, sleeps):
+        ai_service.client = FakeCompletionClient(
+            _openai_error("RateLimitError", 429),
+            _openai_error("APITimeoutError"),
+            _openai_error("APIConnectionError"),
+            _openai_error("InternalServerError", 500),
+            "{}",
+        )
+
+        response = await ai_service._call_with_retry(messages=[])
+
+        assert response.choices[0].message.content == "{}"
+        assert ai_service.client.calls == 5
+        assert len(sleeps) == 4
+        for attempt, delay in enumerate(sleeps):
+            base = ai_service.INITIAL_DELAY * 2 ** attempt
+            assert base <= delay < base + 0.1
+        assert ai_service._breaker.failures == 0
+
+    @pytest.mark.asyncio
+    @pytest.mark.parametrize("make_error", [
+        lambda: ValueError("bad payload"),
+        lambda: _openai_error("BadRequestError", 400),
+    ], ids=["ValueError", "BadRequestError"])
+    async def test_other_errors_are_not_retried(self, ai_service, sleeps, make_error):
+        error = make_error()
+        ai_service.client = FakeCompletionClient(error)
+
+        with pytest.raises(type(error)):
+            await ai_service._call_with_retry(messages=[])
+
+        assert ai_service.client.calls == 1
+        assert sleeps == []
+        assert ai_service._breaker.failures == 0
+        assert ai_service._breaker.allow()
+
+    @pytest.mark.asyncio
+    async def test_exhausted_retries_count_one_breaker_failure(self, ai_service, sleeps):
+        ai_service.client = FakeCompletionClient(_openai_error("APITimeoutError"))
+
+        with pytest.raises(ai_module.APITimeoutError):
+            await ai_service._call_with_retry(messages=[])
+
+        assert ai_service.client.calls == ai_service.MAX_RETRIES + 1
+        assert ai_service._breaker.failures == 1
+
+    @pytest.mark.asyncio
+    @pytest.mark.parametrize("retry_after, expected", [("2", 2.0), ("0.25", 0.25), ("120", 30.0)])
+    async def test_retry_after_header_is_honored(self, ai_service, sleeps, retry_after, expected):
+        """The server's Retry-After replaces the backoff, capped at MAX_DELAY."""
+        ai_service.client = FakeCompletionClient(
+            _openai_error("RateLimitError", 429, {"retry-after": retry_after}), "{}"
+        )
+
+        await ai_service._call_with_retry(messages=[])
+
+        assert sleeps == [expected]
+
+
+# =============================================================================
+# Context Reduction Tests
+# =============================================================================
+
+class TestContextReduction:
+    """Tests for skipping and shrinking the insights prompt context."""
+
+    @pytest.mark.asyncio
+    async def test_trivial_context_skips_the_model(self, ai_service):
+        context = {"spending_summary": {"total_spending": -120.0, "by_category": {
+            "Groceries": {"amount": -100.0, "count": 3},
+            "Transport": {"amount": -20.0, "count": 1},
+        }}}
+        ai_service.client = FakeCompletionClient(json.dumps({"insights": INSIGHTS}))
+
+        result = await ai_service.generate_insights(context)
+
+        assert result == ai_service._fallback_insights(context)
+        assert ai_service.client.calls == 0
+
+    @pytest.mark.parametrize("extra", [
+        {"anomalies": [{"category": "Shopping", "amount": -900.0}]},
+        {"gray_charges_total": 14.97},
+    ], ids=["anomalies", "gray_charges"])
+    def test_anomalies_or_gray_charges_are_not_trivial(self, ai_service, extra):
+        context = {"spending_summary": {"by_category": {"Groceries": {"amount": -100.0}}}}
+
+        assert ai_service._is_trivial_context(context)
+        assert not ai_service._is_trivial_context({**context, **extra})
+
+    def test_shrink_keeps_largest_entries_rounded(self, ai_service):
+        n = 40
+        context = {
+            "spending_summary": {
+                "total_spending": -1234.5678,
+                "by_category": {
+                    f"cat{i}": {"amount": -(i + 0.123), "count": i, "color": "#fff"}
+                    for i in range(n)
+                },
+            },
+            "anomalies": [{"category": "x", "amount": -(i + 0.1234), "transaction_id": i}
+                          for i in range(n)],
+            "recurring_charges": [{"category": "x", "amount": i * 1.005} for i in range(n)],
+            "deltas": [{"category": "x", "change_percent": (-1) ** i * i} for i in range(n)],
+            "transactions": [{"amount": -1.0}] * n,
+        }
+
+        shrunk = ai_service._shrink_context(context)
+
+        by_category = shrunk["spending_summary"]["by_category"]
+        assert list(by_category) == [f"cat{i}" for i in range(n - 1, n - 16, -1)]
+        assert len(by_category) == ai_service.CONTEXT_MAX_CATEGORIES
+        assert by_category[f"cat{n - 1}"] == {"amount": -39.12, "count": 39, "is_essential": None}
+        assert shrunk["spending_summary"]["total_spending"] == -1234.57
+
+        anomalies = shrunk["anomalies"]
+        assert len(anomalies) == ai_service.CONTEXT_MAX_ANOMALIES
+        assert anomalies[0] == {"category": "x", "amount": -39.12, "typical": None, "severity": None}
+        assert len(shrunk["recurring_charges"]) == ai_service.CONTEXT_MAX_RECURRING
+
+        deltas = [d["change_percent"] for d in shrunk["deltas"]]
+        assert deltas == [-39, 38, -37, 36, -35, 34, -33, 32, -31, 30]
+        assert "transactions" not in shrunk
+
+
+# =============================================================================
+# JSON Encoding Tests
+# =============================================================================
+
+class TestJsonDumps:
+    """Tests for the prompt/cache-key JSON encoder."""
+
+    NUMPY_CONTEXT = {
+        "total": np.float64(-1234.5),
+        "count": np.int64(42),
+        "flag": np.bool_(True),
+        "amounts": np.array([1.5, -2.25]),
+        "plain": {"b": 1, "a": 2.0},
+    }
+
+    def test_numpy_values_encode_as_numbers(self):
+        assert ai_module._json_loads(ai_module._json_dumps(self.NUMPY_CONTEXT)) == {
+            "total": -1234.5,
+            "count": 42,
+            "flag": True,
+            "amounts": [1.5, -2.25],
+            "plain": {"a": 2.0, "b": 1},
+        }
+
+    def test_orjson_matches_stdlib(self, monkeypatch):
+        """Cache keys and prompts must not depend on whether orjson is installed."""
+        if ai_module.orjson is None:
+            pytest.skip("orjson not installed")
+        fast = ai_module._json_dumps(self.NUMPY_CONTEXT)
+        monkeypatch.setattr(ai_module, "orjson", None)
+
+        assert ai_module._json_dumps(self.NUMPY_CONTEXT) == fast
+
+
+# =============================================================================
+# HTTP Client Tests
+# =============================================================================
+
+class TestHttpClient:
+    """Tests for the process-wide pooled HTTP client."""
+
+    @pytest.mark.asyncio
+    async def test_keeps_sdk_defaults_with_larger_pool(self, monkeypatch):
+        openai = pytest.importorskip("openai")
+        monkeypatch.setattr(AIService, "_http_client", None)
+
+        client = AIService._get_http_client()
+        try:
+            assert isinstance(client, openai.DefaultAsyncHttpxClient)
+            assert client.timeout == openai.DEFAULT_TIMEOUT
+            assert client.follow_redirects
+            assert AIService._get_http_client() is client
+        finally:
+            await client.aclose()
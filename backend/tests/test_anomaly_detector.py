@@ -209,6 +209,14 @@ class TestSeverityClassification:
         severity = detector._score_to_severity(0.1)
         assert severity == "low"
     
+    def test_confidences_to_severity_never_none(self, mock_db):
+        """Bulk ML severities fall through to 'low' below the medium threshold."""
+        detector = MLAnomalyDetector(mock_db)
+        
+        confidences = np.array([0.0, 0.02, 0.079, 0.08, 0.15, 1.0])
+        severities = detector._confidences_to_severity(confidences).tolist()
+        assert severities == ["low", "low", "low", "medium", "high", "high"]
+    
     def test_score_to_confidence_bounds(self, mock_db):
         """Test confidence score is bounded 0-1."""
         detector = MLAnomalyDetector(mock_db)
@@ -415,6 +423,178 @@ class TestAnomalyDetectorIntegration:
         assert hasattr(detector, '_detect_statistical')
 
 
+class TestAnomalyPersistence:
+    """Tests against a real in-memory SQLite database."""
+
+    @pytest.fixture
+    def sqlite_db(self):
+        """Factory: SQLite session holding one session of n categorized transactions."""
+        from sqlalchemy import create_engine
+        from sqlalchemy.orm import sessionmaker
+        from database import Base
+        from models import Session, Category, Transaction
+
+        def build(n: int):
+            engine = create_engine("sqlite://")
+            Base.metadata.create_all(engine)
+            db = sessionmaker(bind=engine)()
+            db.add(Session(id="s", clerk_user_id="u"))
+            db.add_all([Category(id=1, name="Dining"), Category(id=2, name="Shopping")])
+            rng = np.random.default_rng(1)
+            db.add_all([
+                Transaction(
+                    session_id="s",
+                    date=date(2025, 1, 1) + timedelta(days=i % 90),
+                    description=f"SHOP {i % 7}",
+                    amount=-900.0 if i % 17 == 0 else -float(rng.uniform(10, 40)),
+                    category_id=1 + i % 2,
+                )
+                for i in range(n)
+            ])
+            db.commit()
+            return db
+
+        return build
+
+    def test_ml_low_confidence_hits_store_low_severity(self, sqlite_db):
+        """Weakly flagged ML rows are saved with severity 'low', never NULL."""
+        from models import Anomaly
+
+        db = sqlite_db(120)
+
+        def weak_scores(self, X_scaled):
+            scores = np.full(len(X_scaled), 0.2)
+            scores[::10] = -0.01  # flagged, confidence 0.02 (< medium)
+            return scores
+
+        with patch.object(MLAnomalyDetector, "_decision_scores", weak_scores):
+            created = MLAnomalyDetector(db).detect("s")
+
+        severities = [a.severity for a in db.query(Anomaly)]
+        assert created == 12
+        assert severities == ["low"] * 12
+
+    @pytest.mark.parametrize("n", [30, 120])  # statistical and ML paths
+    def test_detect_twice_adds_nothing(self, sqlite_db, n):
+        """Re-running detection on a session returns 0 and stores no duplicates."""
+        from models import Anomaly
+
+        db = sqlite_db(n)
+        first = AnomalyDetector(db).detect("s")
+        stored = db.query(Anomaly).count()
+
+        assert first > 0
+        assert stored == first
+        assert AnomalyDetector(db).detect("s") == 0
+        assert db.query(Anomaly).count() == stored
+
+    @pytest.mark.parametrize("n", [30, 120])  # statistical and ML paths
+    def test_one_anomaly_per_transaction(self, sqlite_db, n):
+        """A transaction flagged earlier (any type) is not flagged again by pass 1."""
+        from sqlalchemy import func
+        from models import Anomaly
+
+        db = sqlite_db(n)
+        AnomalyDetector(db).detect("s")
+        flagged = [a.transaction_id for a in db.query(Anomaly)]
+        db.query(Anomaly).update({Anomaly.anomaly_type: "gradual_fraud"})
+        db.commit()
+
+        assert AnomalyDetector(db).detect("s") == 0
+        per_transaction = (
+            db.query(Anomaly.transaction_id, func.count())
+            .group_by(Anomaly.transaction_id)
+            .all()
+        )
+        assert sorted(t for t, _ in per_transaction) == sorted(flagged)
+        assert {count for _, count in per_transaction} == {1}
+
+    def test_detect_twice_without_on_conflict(self, sqlite_db):
+        """Dialects without ON CONFLICT skip duplicates instead of raising."""
+        from models import Anomaly
+
+        db = sqlite_db(30)
+        with patch("services.anomaly_detector._dialect_name", return_value="other"):
+            first = AnomalyDetector(db).detect("s")
+            # Bypass the in-process dedupe: every row is a duplicate now
+            rows = [
+                dict(session_id=a.session_id, transaction_id=a.transaction_id,
+                     anomaly_type=a.anomaly_type)
+                for a in db.query(Anomaly)
+            ]
+            from services.anomaly_detector import _insert_anomalies
+            assert _insert_anomalies(db, rows) == 0
+
+        assert first > 0
+        assert db.query(Anomaly).count() == first
+
+
+class TestModelCache:
+    """Tests for the fitted-model cache (memory + opt-in disk tier)."""
+
+    @pytest.fixture
+    def cache_dir(self, tmp_path, monkeypatch):
+        """Enable the disk tier in a temp dir, with an empty memory tier."""
+        from collections import OrderedDict
+        import services.anomaly_detector as ad
+
+        monkeypatch.setattr(ad, "MODEL_CACHE_DIR", str(tmp_path))
+        monkeypatch.setattr(ad, "_MODEL_CACHE", OrderedDict())
+        return tmp_path
+
+    @staticmethod
+    def _matrix(seed: int) -> np.ndarray:
+        return np.random.default_rng(seed).normal(size=(60, 4)).astype(np.float32)
+
+    def test_disk_hit_skips_fit(self, mock_db, cache_dir):
+        """A pickle written by one fit is reused once the memory tier is gone."""
+        import services.anomaly_detector as ad
+
+        MLAnomalyDetector(mock_db)._train_model(self._matrix(0))
+        assert len(list(cache_dir.glob("iforest_*.pkl"))) == 1
+
+        ad._MODEL_CACHE.clear()
+        detector = MLAnomalyDetector(mock_db)
+        with patch.object(ad.IsolationForest, "fit", side_effect=AssertionError("refit")):
+            detector._train_model(self._matrix(0))
+        assert detector.model is not None
+
+    def test_disk_tier_evicts_least_recently_used(self, mock_db, cache_dir, monkeypatch):
+        """Only MODEL_CACHE_MAX_FILES pickles are kept; disk hits count as use."""
+        import os
+        import services.anomaly_detector as ad
+
+        monkeypatch.setattr(ad, "MODEL_CACHE_MAX_FILES", 2)
+        detector = MLAnomalyDetector(mock_db)
+        keys = [detector._model_cache_key(self._matrix(seed)) for seed in range(3)]
+
+        for seed in (0, 1):
+            detector._train_model(self._matrix(seed))
+            os.utime(cache_dir / f"iforest_{keys[seed]}.pkl", (1000 + seed, 1000 + seed))
+
+        ad._MODEL_CACHE.clear()
+        detector._train_model(self._matrix(0))  # Disk hit refreshes key 0
+        detector._train_model(self._matrix(2))  # Evicts key 1
+
+        remaining = {f.name for f in cache_dir.glob("iforest_*.pkl")}
+        assert remaining == {f"iforest_{keys[0]}.pkl", f"iforest_{keys[2]}.pkl"}
+
+    def test_memory_tier_is_bounded(self, mock_db, monkeypatch):
+        """The in-memory tier keeps at most MODEL_CACHE_MAX_ENTRIES pairs."""
+        from collections import OrderedDict
+        import services.anomaly_detector as ad
+
+        monkeypatch.setattr(ad, "MODEL_CACHE_DIR", "")
+        monkeypatch.setattr(ad, "_MODEL_CACHE", OrderedDict())
+        monkeypatch.setattr(ad, "MODEL_CACHE_MAX_ENTRIES", 2)
+
+        detector = MLAnomalyDetector(mock_db)
+        for seed in range(3):
+            detector._train_model(self._matrix(seed))
+
+        assert len(ad._MODEL_CACHE) == 2
+
+
 # =============================================================================
 # Run Tests
 # =============================================================================
@@ -0,0 +1,288 @@
+"""
+Test Module: test_csv_processor.py
+Description: Unit tests for CSV upload parsing and normalization.
+
+Tests:
+    - Vectorized date/amount/description normalization vs per-row rules
+    - Worker-process parsing of large uploads
+
+Author: Smart Financial Coach Team
+"""
+
+import pickle
+import re
+from datetime import date, datetime, timedelta
+from unittest.mock import MagicMock
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import sys
+from pathlib import Path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+import services.csv_processor as csv_module
+from services.csv_processor import (
+    CSVProcessor,
+    DataValidationError,
+    _get_parse_pool,
+    _parse_and_normalize,
+    shutdown_parse_pool,
+)
+
+
+# =============================================================================
+# Reference Implementation (per-row rules the vectorized code replaced)
+# =============================================================================
+
+def _parse_date(val):
+    if pd.isna(val):
+        return None
+    if isinstance(val, datetime):
+        return val.date()
+    val_str = str(val).strip()
+    for fmt in CSVProcessor.DATE_FORMATS:
+        try:
+            return datetime.strptime(val_str, fmt).date()
+        except ValueError:
+            continue
+    try:
+        return pd.to_datetime(val_str).date()
+    except Exception:
+        raise ValueError(f"Cannot parse date: {val_str}")
+
+
+def _parse_amount(val):
+    if pd.isna(val):
+        return 0.0
+    if isinstance(val, (int, float)):
+        return float(val)
+    val_str = str(val).strip()
+    val_str = re.sub(r"[$,]", "", val_str)
+    if val_str.startswith("(") and val_str.endswith(")"):
+        val_str = "-" + val_str[1:-1]
+    try:
+        return float(val_str)
+    except ValueError:
+        return 0.0
+
+
+def _clean_desc(val):
+    if pd.isna(val):
+        return "Unknown"
+    desc = str(val).strip()
+    desc = re.sub(r"\s+", " ", desc)
+    desc = re.sub(r"^(POS |CHECKCARD |DEBIT |CREDIT )", "", desc, flags=re.I)
+    return desc if desc else "Unknown"
+
+
+def _reference_dates(values: list) -> pd.Series:
+    dates = pd.Series(values, dtype=object).apply(_parse_date)
+    return dates.dropna()
+
+
+# =============================================================================
+# Fixtures
+# =============================================================================
+
+def _csv_bytes(rows: list[tuple]) -> bytes:
+    lines = ["date,description,amount"] + [",".join(map(str, r)) for r in rows]
+    return ("\n".join(lines) + "\n").encode("utf-8")
+
+
+@pytest.fixture
+def upload_content() -> bytes:
+    """CSV with mixed date formats and a few rows the validator drops."""
+    start = date.today() - timedelta(days=90)
+    rows = []
+    for i in range(60):
+        day = start + timedelta(days=i)
+        when = day.isoformat() if i % 2 else day.strftime("%m/%d/%Y")
+        rows.append((when, f"POS COFFEE SHOP #{i}", f"-{4 + i % 7}.50"))
+    rows += [
+        ("2001-01-01", "TOO OLD", "-10.00"),
+        (start.isoformat(), "BAD AMOUNT", "abc"),
+        (start.isoformat(), "HUGE", "-999999"),
+        (start.isoformat(), "PAYCHECK", "-2500.00"),
+    ]
+    return _csv_bytes(rows)
+
+
+@pytest.fixture(scope="module")
+def parse_pool():
+    """The shared spawn pool, stopped again after this module's tests."""
+    yield _get_parse_pool()
+    shutdown_parse_pool()
+
+
+class FakeUpload:
+    """Minimal UploadFile stand-in."""
+
+    def __init__(self, content: bytes, filename: str = "upload.csv"):
+        self.content = content
+        self.filename = filename
+
+    async def read(self) -> bytes:
+        return self.content
+
+
+# =============================================================================
+# Parse Offload Tests
+# =============================================================================
+
+class TestParseOffload:
+    """Large uploads parsed in a worker must match inline parsing exactly."""
+
+    def test_worker_frame_matches_inline(self, parse_pool, upload_content):
+        inline = CSVProcessor(db=None)
+        expected = inline._prepare_frame(upload_content)
+
+        frame, warnings = parse_pool.submit(_parse_and_normalize, upload_content).result()
+
+        pd.testing.assert_frame_equal(frame, expected)
+        assert warnings == inline.validation_warnings
+        assert warnings
+
+    @pytest.mark.asyncio
+    async def test_process_offloads_large_uploads(self, parse_pool, upload_content, monkeypatch):
+        """process() inserts the same rows and warnings whichever path parses."""
+        inserted = {}
+
+        async def run(threshold: int, label: str) -> list[str]:
+            monkeypatch.setattr(csv_module, "PARSE_OFFLOAD_MIN_BYTES", threshold)
+            processor = CSVProcessor(db=MagicMock())
+            monkeypatch.setattr(
+                processor, "_insert_transactions",
+                lambda rows: inserted.__setitem__(label, rows))
+            await processor.process(FakeUpload(upload_content), clerk_user_id="u")
+            for row in inserted[label]:
+                row.pop("session_id")
+            return processor.validation_warnings
+
+        inline_warnings = await run(threshold=len(upload_content) + 1, label="inline")
+        offload_warnings = await run(threshold=0, label="offload")
+
+        assert offload_warnings == inline_warnings
+        assert inserted["offload"] == inserted["inline"]
+
+    def test_validation_error_from_worker_keeps_warnings(self, parse_pool):
+        future = (date.today() + timedelta(days=30)).isoformat()
+        content = _csv_bytes([(future, "A", "-1.00"), ("2001-01-01", "B", "-2.00")])
+        inline = CSVProcessor(db=None)
+        with pytest.raises(DataValidationError) as expected:
+            inline._prepare_frame(content)
+
+        with pytest.raises(DataValidationError) as raised:
+            parse_pool.submit(_parse_and_normalize, content).result()
+
+        assert str(raised.value) == str(expected.value)
+        assert raised.value.warnings == expected.value.warnings
+        assert raised.value.warnings
+
+    def test_validation_error_pickles_with_warnings(self):
+        error = DataValidationError("No valid transactions", warnings=["row 1: bad date"])
+
+        restored = pickle.loads(pickle.dumps(error))
+
+        assert type(restored) is DataValidationError
+        assert str(restored) == "No valid transactions"
+        assert restored.warnings == ["row 1: bad date"]
+
+
+# =============================================================================
+# Normalization Tests
+# =============================================================================
+
+DATE_CASES = {
+    "iso": ["2024-01-05", "2024-12-31", " 2024-03-09 "],
+    "us_slash": ["01/05/2024", "1/5/2024", "12/31/2024"],
+    "day_first_fallback": ["13/02/2024", "31/12/2024", "01/02/2024"],
+    "mixed_formats": ["2024-01-05", "02/03/2024", "03-04-2024", "2024/05/06"],
+    "free_text": ["Jan 5, 2024", "5 January 2024", "2024-01-05T10:30:00"],
+    "datetime_objects": [datetime(2024, 1, 5, 10, 30), "2024-02-01", datetime(2024, 3, 1)],
+    "missing": ["2024-01-05", None, np.nan, "", "   "],
+    "out_of_timestamp_range": ["0999-01-01", "2024-01-05"],
+}
+
+AMOUNT_CASES = {
+    "plain": ["12.50", "-3", "0", "1e3"],
+    "currency_and_commas": ["$1,234.56", "-$12.00", "$0.99", "1,000,000"],
+    "parenthesized_negatives": ["(45.00)", "($1,000.50)", "(7)"],
+    "padding": ["  12.5 ", "\t-4\t"],
+    "unparseable": ["abc", "", "(12", "12)", "€12", "USD 5", None, np.nan],
+    "numeric_objects": [12, -3.5, "4.25", 0],
+}
+
+DESCRIPTION_CASES = {
+    "prefixes": ["POS COFFEE", "pos coffee", "CHECKCARD GAS", "DEBIT X", "CREDIT Y"],
+    "whitespace": ["  SPOTIFY  USA  ", "A\tB\nC", "POS   SHOP", "DEBIT"],
+    "empty": [None, np.nan, "", "   ", "POS "],
+    "plain": ["NETFLIX.COM", "Amazon Prime*MK123", "#123 ORDER"],
+}
+
+
+class TestNormalization:
+    """Vectorized normalizers must match the original per-row functions."""
+
+    @pytest.mark.parametrize("values", DATE_CASES.values(), ids=DATE_CASES.keys())
+    def test_dates_match_per_row(self, values):
+        df = pd.DataFrame({"date": pd.Series(values, dtype=object)})
+
+        result = CSVProcessor(db=None)._normalize_dates(df)
+
+        expected = _reference_dates(values)
+        assert result.index.tolist() == expected.index.tolist()
+        assert result["date"].tolist() == expected.tolist()
+
+    def test_datetime64_column_matches_per_row(self):
+        values = pd.Series(pd.to_datetime(["2024-01-05 10:30", None, "2024-02-01 00:00"]))
+        expected = values.apply(_parse_date).dropna()
+
+        result = CSVProcessor(db=None)._normalize_dates(pd.DataFrame({"date": values}))
+
+        assert result.index.tolist() == expected.index.tolist()
+        assert result["date"].tolist() == expected.tolist()
+
+    @pytest.mark.parametrize("values", [
+        ["2024-01-05", "not a date"],
+        ["32/13/2024"],
+        ["2024-01-05", "2024-13-45", "02/30/2024"],
+    ])
+    def test_unparseable_dates_raise_like_per_row(self, values):
+        with pytest.raises(ValueError, match="Cannot parse date") as expected:
+            _reference_dates(values)
+        df = pd.DataFrame({"date": pd.Series(values, dtype=object)})
+
+        with pytest.raises(ValueError, match="Cannot parse date") as raised:
+            CSVProcessor(db=None)._normalize_dates(df)
+
+        first_bad = str(expected.value).split(": ", 1)[1]
+        assert first_bad in str(raised.value)
+
+    @pytest.mark.parametrize("values", AMOUNT_CASES.values(), ids=AMOUNT_CASES.keys())
+    def test_amounts_match_per_row(self, values):
+        df = pd.DataFrame({"amount": pd.Series(values, dtype=object)})
+
+        result = CSVProcessor(db=None)._normalize_amounts(df)
+
+        assert result["amount"].tolist() == [_parse_amount(v) for v in values]
+        assert result["amount"].dtype == float
+
+    def test_numeric_amount_column_matches_per_row(self):
+        values = [12.0, -3.5, np.nan, 0.0]
+        df = pd.DataFrame({"amount": values})
+
+        result = CSVProcessor(db=None)._normalize_amounts(df)
+
+        assert result["amount"].tolist() == [_parse_amount(v) for v in values]
+
+    @pytest.mark.parametrize(
+        "values", DESCRIPTION_CASES.values(), ids=DESCRIPTION_CASES.keys())
+    def test_descriptions_match_per_row(self, values):
+        df = pd.DataFrame({"description": pd.Series(values, dtype=object)})
+
+        result = CSVProcessor(db=None)._clean_descriptions(df)
+
+        assert result["description"].tolist() == [_clean_desc(v) for v in values]
+        assert result["raw_description"].equals(pd.Series(values, dtype=object))
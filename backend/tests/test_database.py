@@ -0,0 +1,81 @@
+"""
+Test Module: test_database.py
+Description: Unit tests for schema migrations run by init_db.
+
+Tests:
+    - Anomalies unique index migration
+
+Author: Smart Financial Coach Team
+"""
+
+import pytest
+from sqlalchemy import create_engine, inspect, text
+
+import sys
+from pathlib import Path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from database import (
+    Base,
+    ANOMALY_UNIQUE_INDEX,
+    migrate_anomaly_unique_index,
+)
+import models  # noqa: F401  (registers tables on Base.metadata)
+
+
+# =============================================================================
+# Fixtures
+# =============================================================================
+
+@pytest.fixture
+def legacy_engine(tmp_path):
+    """Database in the pre-index state, holding duplicate anomalies."""
+    engine = create_engine(f"sqlite:///{tmp_path / 'legacy.db'}")
+    Base.metadata.create_all(engine)
+    with engine.begin() as conn:
+        conn.execute(text(f"DROP INDEX {ANOMALY_UNIQUE_INDEX}"))
+        conn.execute(text("INSERT INTO sessions (id, clerk_user_id) VALUES ('s', 'u')"))
+        for anomaly_type in ("amount", "amount", "velocity_spike", None, None):
+            conn.execute(
+                text("INSERT INTO anomalies (session_id, transaction_id, anomaly_type) "
+                     "VALUES ('s', 1, :t)"),
+                {"t": anomaly_type},
+            )
+    return engine
+
+
+def _anomaly_types(engine) -> list:
+    with engine.connect() as conn:
+        return [row[0] for row in conn.execute(
+            text("SELECT anomaly_type FROM anomalies ORDER BY id"))]
+
+
+def _index_names(engine) -> set:
+    return {ix["name"] for ix in inspect(engine).get_indexes("anomalies")}
+
+
+# =============================================================================
+# Anomaly Index Migration Tests
+# =============================================================================
+
+class TestAnomalyIndexMigration:
+    """Tests for the one-time anomalies unique index migration."""
+
+    def test_removes_only_exact_duplicates(self, legacy_engine):
+        """Different anomaly types for one transaction survive the migration."""
+        migrate_anomaly_unique_index(legacy_engine)
+
+        assert _anomaly_types(legacy_engine) == ["amount", "velocity_spike", None, None]
+        assert ANOMALY_UNIQUE_INDEX in _index_names(legacy_engine)
+
+    def test_noop_once_index_exists(self, legacy_engine):
+        """Rows added after the migration are never touched by later starts."""
+        migrate_anomaly_unique_index(legacy_engine)
+        with legacy_engine.begin() as conn:
+            conn.execute(text(
+                "INSERT INTO anomalies (session_id, transaction_id, anomaly_type) "
+                "VALUES ('s', 1, NULL)"))
+
+        migrate_anomaly_unique_index(legacy_engine)
+
+        assert _anomaly_types(legacy_engine) == ["amount", "velocity_spike", None, None, None]
@@ -0,0 +1,160 @@
+"""
+Test Module: test_recurring_detector.py
+Description: Unit tests for recurring charge grouping and interval statistics.
+
+Tests:
+    - Description normalization against the original per-row rules
+    - Group interval/amount statistics against the original loops
+
+Author: Smart Financial Coach Team
+"""
+
+import random
+import re
+from datetime import date, timedelta
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+import sys
+from pathlib import Path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from services.recurring_detector import RecurringDetector, _group_stats
+
+
+# =============================================================================
+# Reference Implementation (per-row rules the vectorized code replaced)
+# =============================================================================
+
+def _normalize_for_matching(description: str) -> str:
+    s = description.upper()
+    s = re.sub(r"\d{4,}", "", s)
+    s = re.sub(r"#\d+", "", s)
+    s = re.sub(r"\*+", "", s)
+    s = re.sub(r"\s+", " ", s)
+    s = s.strip()
+    return s[:30] if len(s) > 30 else s
+
+
+def _calculate_intervals(transactions) -> list[int]:
+    dates = sorted([t.date for t in transactions])
+    return [(dates[i] - dates[i - 1]).days for i in range(1, len(dates))]
+
+
+def _variance(values: list[float]) -> float:
+    if len(values) < 2:
+        return 0
+    mean = sum(values) / len(values)
+    return sum((x - mean) ** 2 for x in values) / len(values)
+
+
+# =============================================================================
+# Fixtures
+# =============================================================================
+
+NOISY_DESCRIPTIONS = [
+    "NETFLIX.COM #123",
+    "netflix.com #45",
+    "AMAZON PRIME*MK1234567 ****1234",
+    "Amazon Prime*MK7654321 ****9876",
+    "SPOTIFY USA 8885551234567",
+    "spotify   usa  #1",
+    "ORDER #12345 WIDGETS",
+    "ORDER #123 WIDGETS",
+    "ORDER 12#345 WIDGETS",
+    "1234#5678 TRANSFER",
+    "#0001234 REFUND",
+    "#*12 ODD CHARACTERS",
+    "POS   COFFEE ROASTERS OF THE PACIFIC NORTHWEST 0042",
+    "COFFEE ROASTERS OF THE PACIFIC NORTHWEST 99",
+    "GYM MEMBERSHIP 555",
+    "GYM MEMBERSHIP    ",
+    "   ",
+    "***",
+]
+
+
+@pytest.fixture
+def noisy_transactions():
+    """Date-ordered spending rows with ID-laden, inconsistent descriptions."""
+    rng = random.Random(7)
+    start = date.today() - timedelta(days=240)
+    rows = []
+    for description in NOISY_DESCRIPTIONS:
+        step = rng.choice([7, 14, 30, 31, 45])
+        for k in range(rng.randint(1, 8)):
+            rows.append(SimpleNamespace(
+                date=start + timedelta(days=k * step + rng.randint(-2, 2)),
+                amount=-round(rng.uniform(1, 120), 2),
+                description=description,
+            ))
+    rows.sort(key=lambda t: t.date)
+    return rows
+
+
+# =============================================================================
+# Grouping Tests
+# =============================================================================
+
+class TestGrouping:
+    """The vectorized grouping must reproduce the per-row normalization."""
+
+    @pytest.mark.parametrize("description", NOISY_DESCRIPTIONS)
+    def test_normalization_matches_per_row_rules(self, description):
+        detector = RecurringDetector(db=None)
+        patterns, _ = detector._group_similar_transactions([description])
+        assert patterns[0] == _normalize_for_matching(description)
+
+    def test_groups_match_per_row_grouping(self, noisy_transactions):
+        expected: dict[str, list[int]] = {}
+        for i, t in enumerate(noisy_transactions):
+            expected.setdefault(_normalize_for_matching(t.description), []).append(i)
+
+        detector = RecurringDetector(db=None)
+        patterns, codes = detector._group_similar_transactions(
+            [t.description for t in noisy_transactions])
+
+        actual = {
+            pattern: np.flatnonzero(codes == code).tolist()
+            for code, pattern in enumerate(patterns)
+        }
+        assert actual == expected
+
+
+# =============================================================================
+# Group Statistics Tests
+# =============================================================================
+
+class TestGroupStats:
+    """_group_stats must agree with the per-group interval loops."""
+
+    def test_stats_match_per_group_loops(self, noisy_transactions):
+        detector = RecurringDetector(db=None)
+        patterns, codes = detector._group_similar_transactions(
+            [t.description for t in noisy_transactions])
+        days = np.array([t.date.toordinal() for t in noisy_transactions], dtype=np.int64)
+        amounts = np.array([t.amount for t in noisy_transactions])
+
+        stats = _group_stats(codes, days, amounts)
+
+        for code, pattern in enumerate(patterns):
+            txns = [t for t, c in zip(noisy_transactions, codes) if c == code]
+            rows = np.flatnonzero(codes == code)
+            intervals = _calculate_intervals(txns)
+
+            assert stats["count"][code] == len(txns)
+            assert stats["avg_amount"][code] == pytest.approx(
+                sum(t.amount for t in txns) / len(txns))
+            assert stats["first_row"][code] == rows[0]
+            assert stats["first_day"][code] == min(t.date for t in txns).toordinal()
+            assert stats["last_day"][code] == max(t.date for t in txns).toordinal()
+            if intervals:
+                assert stats["avg_interval"][code] == pytest.approx(
+                    sum(intervals) / len(intervals))
+                assert stats["interval_variance"][code] == pytest.approx(
+                    _variance(intervals))
+            else:
+                assert np.isnan(stats["avg_interval"][code])
+                assert np.isnan(stats["interval_variance"][code])